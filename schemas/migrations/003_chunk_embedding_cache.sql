@@ -0,0 +1,21 @@
+-- Chunk Embedding Cache
+-- Purpose: Skip re-embedding unchanged chunks on re-ingestion
+--
+-- ingest_from_source.py deletes and rewrites document_chunk rows on every run.
+-- Embeddings are looked up here first, keyed by the SHA-256 of the chunk text
+-- and scoped by model + dimensions, so only new or edited chunks hit the
+-- OpenAI embeddings API.
+--
+-- Pure cache: safe to TRUNCATE at any time (next run re-populates it).
+
+CREATE TABLE IF NOT EXISTS chunk_embedding_cache (
+ model TEXT NOT NULL, -- e.g., 'text-embedding-3-small'
+ dimensions INTEGER NOT NULL,
+ key TEXT NOT NULL, -- sha256 hex of chunk content
+ embedding vector NOT NULL,
+ created_at TIMESTAMPTZ NOT NULL DEFAULT now,
+ PRIMARY KEY (model, dimensions, key)
+);
+
+COMMENT ON TABLE chunk_embedding_cache IS 'Content-addressed embedding cache for document_chunk ingestion';
+COMMENT ON COLUMN chunk_embedding_cache.key IS 'SHA-256 hex digest of the chunk text';
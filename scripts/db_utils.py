@@ -15,24 +15,31 @@ set in the environment take precedence.
 
 from __future__ import annotations
 
+import functools
 import os
+import re
 from pathlib import Path
 
 import psycopg
 
+ENV_FILE = Path(__file__).parent.parent / ".env"
+
+# KEY=value lines; comments and blank lines never match
+ENV_LINE_PATTERN = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$", re.MULTILINE)
+
+
+@functools.cache
+def read_env_file(env_file: Path = ENV_FILE) -> dict[str, str]:
+ """Parse a .env file into a dict (cached per path; empty if missing)."""
+ if not env_file.exists:
+ return {}
+ return dict(ENV_LINE_PATTERN.findall(env_file.read_text))
+
 
 def load_env -> None:
  """Load .env file into os.environ. Existing env vars take precedence."""
- env_file = Path(__file__).parent.parent / ".env"
- if not env_file.exists:
- return
- with open(env_file) as f:
- for line in f:
- line = line.strip
- if line and "=" in line and not line.startswith("#"):
- key, value = line.split("=", 1)
- if key not in os.environ:
- os.environ[key] = value
+ for key, value in read_env_file.items:
+ os.environ.setdefault(key, value)
 
 
 def get_db_connection(
@@ -55,6 +62,18 @@ def get_db_connection(
  SEMOPS_DB_USER > POSTGRES_USER > "postgres"
  SEMOPS_DB_PASSWORD > POSTGRES_PASSWORD > "postgres"
  """
+ conn = psycopg.connect(get_conninfo)
+
+ if autocommit:
+ conn.autocommit = True
+
+ _set_search_path(conn, schema)
+
+ return conn
+
+
+def get_conninfo -> str:
+ """Build the connection URL from SEMOPS_DB_* / POSTGRES_* env vars (see get_db_connection)."""
  load_env
 
  host = os.environ.get("SEMOPS_DB_HOST") or os.environ.get("POSTGRES_HOST", "localhost")
@@ -67,13 +86,11 @@ def get_db_connection(
  if host == "db":
  host = "localhost"
 
- conn = psycopg.connect(f"postgresql://{user}:{password}@{host}:{port}/{db}")
+ return f"postgresql://{user}:{password}@{host}:{port}/{db}"
 
- if autocommit:
- conn.autocommit = True
 
+def _set_search_path(conn: psycopg.Connection, schema: str | None = None) -> None:
+ """SET search_path when a non-public schema is requested (arg or SEMOPS_DB_SCHEMA)."""
  target_schema = schema or os.environ.get("SEMOPS_DB_SCHEMA")
  if target_schema and target_schema != "public":
  conn.execute(f"SET search_path TO {target_schema}, public")
-
- return conn
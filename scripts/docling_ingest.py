@@ -140,11 +140,9 @@ def derive_entity_id(file_path: Path) -> str:
 
 def compute_file_hash(file_path: Path) -> str:
  """Compute SHA256 hash of file."""
- sha256 = hashlib.sha256
  with open(file_path, "rb") as f:
- for chunk in iter(lambda: f.read(8192), b""):
- sha256.update(chunk)
- return sha256.hexdigest
+ # Streams the file through OpenSSL without a Python-level read loop
+ return hashlib.file_digest(f, "sha256").hexdigest
 
 
 def ingest_document(
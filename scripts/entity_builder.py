@@ -26,6 +26,8 @@ from typing import Any, Optional
 from github_fetcher import FetchedFile
 from source_config import SourceConfig
 
+WORD_PATTERN = re.compile(r"\w+")
+
 
 @dataclass
 class LLMClassification:
@@ -139,7 +141,7 @@ class EntityBuilder:
 
  def count_words(self, content: str) -> int:
  """Count words in content."""
- return len(re.findall(r"\w+", content))
+ return sum(1 for _ in WORD_PATTERN.finditer(content))
 
  def build_filespec(self, fetched: FetchedFile) -> dict[str, Any]:
  """
@@ -20,10 +20,18 @@ import fnmatch
 import hashlib
 import json
 import subprocess
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
+# Concurrent `gh api` fetches; low enough to stay clear of GitHub's
+# secondary (concurrency) rate limits.
+FETCH_CONCURRENCY = 8
+
 
 @dataclass
 class FileMetadata:
@@ -205,6 +213,58 @@ class GitHubFetcher:
 
  return FetchedFile(content=content, metadata=metadata)
 
+ def fetch_files(
+ self,
+ paths: Iterable[str],
+ max_workers: int = FETCH_CONCURRENCY,
+ ) -> Iterator[tuple[str, FetchedFile | Exception]]:
+ """
+ Fetch many files concurrently, yielding results in input order.
+
+ Each fetch is an independent `gh api` subprocess, so a small thread pool
+ overlaps the network waits. Fetches are submitted as results are yielded,
+ keeping at most max_workers * 2 in flight or unconsumed, so a slow
+ consumer never holds more than that many files in memory. Failures are
+ yielded rather than raised so the caller can handle them per file.
+
+ Args:
+ paths: File paths relative to repo root
+ max_workers: Maximum concurrent fetches
+
+ Yields:
+ (path, FetchedFile) or (path, exception) for each path
+ """
+
+ def fetch(path: str) -> tuple[str, FetchedFile | Exception]:
+ try:
+ return path, self._fetch_with_backoff(path)
+ except Exception as e:
+ return path, e
+
+ window = max_workers * 2
+ pending: deque[Future] = deque
+ with ThreadPoolExecutor(max_workers=max_workers) as executor:
+ for path in paths:
+ pending.append(executor.submit(fetch, path))
+ if len(pending) >= window:
+ yield pending.popleft.result
+
+ while pending:
+ yield pending.popleft.result
+
+ def _fetch_with_backoff(self, path: str, retries: int = 3) -> FetchedFile:
+ """Fetch a file, backing off exponentially when GitHub reports a rate limit."""
+ delay = 2.0
+ for attempt in range(retries + 1):
+ try:
+ return self.fetch_file(path)
+ except RuntimeError as e:
+ if attempt == retries or "rate limit" not in str(e).lower:
+ raise
+ time.sleep(delay)
+ delay *= 2
+ raise RuntimeError(f"Failed to fetch {path}")
+
  def build_uri(self, path: str) -> str:
  """
  Build a github:// URI for a file.
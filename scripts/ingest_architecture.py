@@ -23,12 +23,12 @@ import argparse
 import json
 import os
 import re
-import subprocess
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+import httpx
 import psycopg
 import yaml
 from rich.console import Console
@@ -63,29 +63,36 @@ NEO4J_URL = os.environ.get("NEO4J_URL", "http://localhost:7474")
 
 
 # ---------------------------------------------------------------------------
-# Neo4j utilities (reused from materialize_graph.py)
+# Neo4j utilities (HTTP API, one keep-alive session per run)
 # ---------------------------------------------------------------------------
+# Backslash and single quote escaped in one pass. Parameterized statements
+# (as in materialize_graph) would make this unnecessary.
+CYPHER_ESCAPES = str.maketrans({"\\": "\\\\", "'": "\\'"})
+
+
 def neo4j_escape(s: str) -> str:
  """Escape string for Cypher."""
- return s.replace("\\", "\\\\").replace("'", "\\'")
+ return s.translate(CYPHER_ESCAPES)
+
+
+_neo4j_client: httpx.Client | None = None
 
 
 def run_cypher(cypher: str) -> dict | None:
- """Execute Cypher statement via Neo4j HTTP API."""
+ """Execute Cypher statement via Neo4j HTTP API.
+
+ Reuses one keep-alive HTTP session instead of spawning curl per statement.
+ """
+ global _neo4j_client
+ if _neo4j_client is None:
+ _neo4j_client = httpx.Client(base_url=NEO4J_URL, timeout=10)
  try:
- result = subprocess.run(
- [
- "curl", "-s",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"statements": [{"statement": cypher}]}),
- f"{NEO4J_URL}/db/neo4j/tx/commit",
- ],
- capture_output=True,
- text=True,
- timeout=10,
- )
- return json.loads(result.stdout) if result.returncode == 0 else None
- except Exception:
+ response = _neo4j_client.post(
+ "/db/neo4j/tx/commit",
+ json={"statements": [{"statement": cypher}]},
+ )
+ return response.json
+ except (httpx.HTTPError, ValueError):
  return None
 
 
@@ -19,19 +19,26 @@ Usage:
 from __future__ import annotations
 
 import argparse
-import hashlib
-import json
 import os
 import re
-import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, UTC
 from pathlib import Path
 from typing import Optional
 
+import httpx
+import orjson
 import psycopg
+import xxhash
 import yaml
 
+try:
+ import re2 # google-re2: linear-time matching, no backtracking blowup
+except ImportError:
+ re2 = re
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -45,31 +52,54 @@ from db_utils import get_db_connection
 
 NEO4J_URL = os.environ.get("NEO4J_URL", "http://localhost:7474")
 
+# Compiled once, reused for every domain pattern doc (RE2 when available)
+TITLE_PATTERN = re2.compile(r"(?m)^#\s+(.+)$")
+BLOCKQUOTE_PATTERN = re2.compile(r"(?m)^>\s+(.+)$")
+PROVENANCE_PATTERN = re2.compile(r"(?i)provenance.*3p|3p.*standard")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Every registry edge carries the same metadata; serialize it once
+PATTERN_EDGE_METADATA = orjson.dumps({"source": "pattern_v1.yaml"}).decode
+
 
 # ---------------------------------------------------------------------------
-# Neo4j utilities (same pattern as ingest_architecture.py)
+# Neo4j utilities (HTTP API, one keep-alive session per run)
 # ---------------------------------------------------------------------------
+# Single-pass table for neo4j_escape
+CYPHER_ESCAPES = str.maketrans({"\\": "\\\\", "'": "\\'"})
+
+
 def neo4j_escape(s: str) -> str:
  """Escape string for Cypher."""
- return s.replace("\\", "\\\\").replace("'", "\\'")
+ return s.translate(CYPHER_ESCAPES)
+
+
+_neo4j_client: httpx.Client | None = None
+_neo4j_down = False
 
 
 def run_cypher(cypher: str) -> dict | None:
- """Execute Cypher statement via Neo4j HTTP API."""
+ """Execute Cypher statement via Neo4j HTTP API.
+
+ Uses one keep-alive HTTP session for the whole run. The first connection
+ failure marks Neo4j as down and every later call returns None without
+ touching the network, so no separate health probe is needed.
+ """
+ global _neo4j_client, _neo4j_down
+ if _neo4j_down:
+ return None
+ if _neo4j_client is None:
+ _neo4j_client = httpx.Client(base_url=NEO4J_URL, timeout=10)
  try:
- result = subprocess.run(
- [
- "curl", "-s",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"statements": [{"statement": cypher}]}),
- f"{NEO4J_URL}/db/neo4j/tx/commit",
- ],
- capture_output=True,
- text=True,
- timeout=10,
+ response = _neo4j_client.post(
+ "/db/neo4j/tx/commit",
+ json={"statements": [{"statement": cypher}]},
  )
- return json.loads(result.stdout) if result.returncode == 0 else None
- except Exception:
+ return response.json
+ except httpx.TransportError:
+ _neo4j_down = True
+ return None
+ except ValueError:
  return None
 
 
@@ -86,66 +116,96 @@ def load_pattern_registry -> list[dict]:
 # ---------------------------------------------------------------------------
 # Markdown helpers
 # ---------------------------------------------------------------------------
-def extract_title(content: str, filename: str) -> str:
- """Extract H1 title from markdown, fallback to filename."""
- match = re.search(r"^#\s+(.+)$", content, re.MULTILINE)
- if match:
- return match.group(1).strip
- return filename.replace("-", " ").replace("_", " ").title
+def parse_md(md_file: Path) -> tuple[str, Optional[str], str, int, str, int]:
+ """Scan a markdown file once for title, description, provenance, word count, hash and size.
 
+ Single line-by-line pass over the raw bytes: the hash is updated
+ incrementally and provenance is matched case-insensitively per line, so
+ neither the document nor its lines are copied (no .lower / .encode).
 
-def extract_description(content: str) -> Optional[str]:
- """Extract first blockquote or paragraph after title as description."""
- bq_match = re.search(r"^>\s+(.+)$", content, re.MULTILINE)
- if bq_match:
- desc = bq_match.group(1).strip
- if len(desc) > 20:
- return desc[:500]
+ The size comes from the bytes read, so no separate stat call is needed.
 
- lines = content.split("\n")
+ Returns:
+ (title, description, provenance, word_count, content_hash, size_bytes)
+ """
+ # content_hash is a 64-bit change-detection fingerprint, not a security
+ # primitive: XXH3 keeps the 16-hex-char width at a fraction of SHA-256 cost.
+ h = xxhash.xxh3_128
+ title = None
+ blockquote = None
+ paragraph: list[str] = []
  collecting = False
- paragraph = []
- for line in lines:
+ paragraph_done = False
+ provenance = "1p"
+ word_count = 0
+ size_bytes = 0
+
+ with open(md_file, "rb") as f:
+ for raw in f:
+ h.update(raw)
+ size_bytes += len(raw)
+ line = raw.decode("utf-8").rstrip("\r\n")
+ word_count += len(WORD_PATTERN.findall(line))
+
+ if provenance == "1p" and (b"3p" in raw or b"3P" in raw):
+ if PROVENANCE_PATTERN.search(line):
+ provenance = "3p"
+
+ if title is None:
+ match = TITLE_PATTERN.match(line)
+ if match:
+ title = match.group(1).strip
+
+ if blockquote is None:
+ bq_match = BLOCKQUOTE_PATTERN.match(line)
+ if bq_match:
+ blockquote = bq_match.group(1).strip
+
+ # First paragraph after the H1 (fallback description)
+ if not paragraph_done:
  if line.startswith("# "):
  collecting = True
- continue
- if collecting:
+ elif collecting:
  stripped = line.strip
  if stripped and not stripped.startswith(">") and not stripped.startswith("---"):
  paragraph.append(stripped)
  elif paragraph:
- break
- if paragraph:
- return " ".join(paragraph)[:500]
- return None
+ paragraph_done = True
+
+ if title is None:
+ title = md_file.stem.replace("-", " ").replace("_", " ").title
+
+ description = None
+ if blockquote and len(blockquote) > 20:
+ description = blockquote[:500]
+ elif paragraph:
+ description = " ".join(paragraph)[:500]
+
+ return title, description, provenance, word_count, h.hexdigest[:16], size_bytes
 
 
 def map_doc_to_pattern(patterns: list[dict]) -> dict[str, str]:
  """Build mapping from doc filename to pattern ID."""
- doc_to_pattern = {}
+ doc_to_pattern: dict[str, str] = {}
  for p in patterns:
  doc = p.get("documentation", {})
- primary = doc.get("primary", "")
- if "domain-patterns/" in primary:
- filename = primary.split("domain-patterns/")[-1]
+ _, sep, filename = doc.get("primary", "").rpartition("domain-patterns/")
+ if sep:
  doc_to_pattern[filename] = p["id"]
  for related in doc.get("related", []):
- if "domain-patterns/" in related:
- filename = related.split("domain-patterns/")[-1]
- if filename not in doc_to_pattern:
- doc_to_pattern[filename] = p["id"]
+ _, sep, filename = related.rpartition("domain-patterns/")
+ if sep:
+ doc_to_pattern.setdefault(filename, p["id"])
  return doc_to_pattern
 
 
 # ---------------------------------------------------------------------------
 # Step 1: Pattern registry → pattern table
 # ---------------------------------------------------------------------------
-def ingest_patterns(conn: Optional[psycopg.Connection], patterns: list[dict], dry_run: bool = False) -> int:
- """Upsert patterns from registry into pattern table."""
+def ingest_patterns(cur: Optional[psycopg.Cursor], patterns: list[dict], dry_run: bool = False) -> int:
+ """Upsert patterns from registry into pattern table (caller commits)."""
  count = 0
- cur = conn.cursor if conn else None
 
- try:
  for p in patterns:
  pattern_id = p["id"]
  name = p["name"]
@@ -178,28 +238,21 @@ def ingest_patterns(conn: Optional[psycopg.Connection], patterns: list[dict], dr
  metadata = EXCLUDED.metadata,
  updated_at = now
  """,
- (pattern_id, name, definition, provenance, json.dumps(metadata)),
+ (pattern_id, name, definition, provenance, orjson.dumps(metadata).decode),
  )
  count += 1
- finally:
- if cur:
- cur.close
 
- if conn:
- conn.commit
  return count
 
 
 # ---------------------------------------------------------------------------
 # Step 2: Pattern edges (SKOS hierarchy)
 # ---------------------------------------------------------------------------
-def create_pattern_edges(conn: Optional[psycopg.Connection], patterns: list[dict], dry_run: bool = False) -> int:
- """Create pattern_edge relationships from derives_from."""
+def create_pattern_edges(cur: Optional[psycopg.Cursor], patterns: list[dict], dry_run: bool = False) -> int:
+ """Create pattern_edge relationships from derives_from (caller commits)."""
  count = 0
  pattern_ids = {p["id"] for p in patterns}
- cur = conn.cursor if conn else None
 
- try:
  for p in patterns:
  derives_from = p.get("derives_from", [])
  if not derives_from:
@@ -221,67 +274,62 @@ def create_pattern_edges(conn: Optional[psycopg.Connection], patterns: list[dict
  VALUES (%s, %s, %s, %s)
  ON CONFLICT (src_id, dst_id, predicate) DO NOTHING
  """,
- (p["id"], parent_id, predicate, json.dumps({"source": "pattern_v1.yaml"})),
+ (p["id"], parent_id, predicate, PATTERN_EDGE_METADATA),
  )
  count += 1
- finally:
- if cur:
- cur.close
 
- if conn:
- conn.commit
  return count
 
 
 # ---------------------------------------------------------------------------
 # Step 3: Domain pattern docs → content entities
 # ---------------------------------------------------------------------------
-def ingest_doc_entities(
- conn: Optional[psycopg.Connection],
- doc_to_pattern: dict[str, str],
- dry_run: bool = False,
-) -> int:
- """Ingest domain pattern markdown files as content entities."""
- count = 0
+def parse_doc_files -> list[tuple[Path, tuple]]:
+ """
+ Parse every domain pattern doc, pairing each file with parse_md's result.
 
+ Parsing is CPU-bound and independent per file, so it fans out to worker
+ processes. main calls this before opening any DB resources: the workers
+ are forked, and must not inherit a live libpq socket.
+ """
  if not DOMAIN_PATTERNS_DIR.exists:
  print(f" ⚠ Domain patterns directory not found: {DOMAIN_PATTERNS_DIR}")
- return 0
+ return []
 
- md_files = sorted(DOMAIN_PATTERNS_DIR.glob("*.md"))
- cur = conn.cursor if conn else None
+ md_files = [
+ f for f in sorted(DOMAIN_PATTERNS_DIR.glob("*.md")) if f.name not in SKIP_FILES
+ ]
+ with ProcessPoolExecutor as executor:
+ return list(zip(md_files, executor.map(parse_md, md_files, chunksize=16)))
 
- try:
- for md_file in md_files:
- if md_file.name in SKIP_FILES:
- continue
 
- content = md_file.read_text(encoding="utf-8")
- title = extract_title(content, md_file.stem)
- description = extract_description(content)
+def ingest_doc_entities(
+ cur: Optional[psycopg.Cursor],
+ doc_to_pattern: dict[str, str],
+ parsed_docs: list[tuple[Path, tuple]],
+ dry_run: bool = False,
+) -> int:
+ """Ingest parsed domain pattern docs (from parse_doc_files) as content entities (caller commits)."""
+ count = 0
+
+ rows: list[tuple] = []
 
+ for md_file, (
+ title, description, provenance, word_count, content_hash, size_bytes
+ ) in parsed_docs:
  entity_id = f"dp-{md_file.stem}"
  pattern_id = doc_to_pattern.get(md_file.name)
 
- # Detect provenance from content
- provenance = "1p"
- content_lower = content.lower
- if any(kw in content_lower for kw in ["3p", "w3c", "industry", "external standard"]):
- if re.search(r"provenance.*3p|3p.*standard", content_lower):
- provenance = "3p"
-
- stat = md_file.stat
  filespec = {
  "$schema": "filespec_v1",
  "filename": md_file.name,
  "extension": ".md",
- "size_bytes": stat.st_size,
+ "size_bytes": size_bytes,
  "mime_type": "text/markdown",
  "storage_path": f"semops-dx-orchestrator/docs/domain-patterns/{md_file.name}",
- "content_hash": hashlib.sha256(content.encode).hexdigest[:16],
+ "content_hash": content_hash,
  }
 
- word_count = len(re.findall(r"\w+", content))
  metadata = {
  "$schema": "content_metadata_v1",
  "content_type": "domain-pattern",
@@ -304,8 +352,21 @@ def ingest_doc_entities(
  pattern_info = f" → pattern:{pattern_id}" if pattern_id else ""
  print(f" {status} entity: {entity_id} | {title[:50]}{pattern_info}")
 
- if cur:
- cur.execute(
+ rows.append(
+ (
+ entity_id,
+ "file",
+ title,
+ pattern_id,
+ orjson.dumps(filespec).decode,
+ orjson.dumps(attribution).decode,
+ orjson.dumps(metadata).decode,
+ )
+ )
+ count += 1
+
+ if cur and rows:
+ cur.executemany(
  """
  INSERT INTO entity (
  id, entity_type, asset_type, title, primary_pattern_id,
@@ -319,23 +380,9 @@ def ingest_doc_entities(
  metadata = EXCLUDED.metadata,
  updated_at = now
  """,
- (
- entity_id,
- "file",
- title,
- pattern_id,
- json.dumps(filespec),
- json.dumps(attribution),
- json.dumps(metadata),
- ),
+ rows,
  )
- count += 1
- finally:
- if cur:
- cur.close
 
- if conn:
- conn.commit
  return count
 
 
@@ -349,16 +396,14 @@ def materialize_neo4j(
  """Materialize Pattern nodes and SKOS edges to Neo4j."""
  counts = {"nodes": 0, "relationships": 0}
 
- health = run_cypher("RETURN 1")
- if health is None:
- print(f" ⚠ Cannot connect to Neo4j at {NEO4J_URL} — skipping")
- return counts
-
- # Constraint
+ # Constraint (first real statement doubles as the liveness check)
  run_cypher(
  "CREATE CONSTRAINT pattern_id IF NOT EXISTS "
  "FOR (p:Pattern) REQUIRE p.id IS UNIQUE"
  )
+ if _neo4j_down:
+ print(f" ⚠ Cannot connect to Neo4j at {NEO4J_URL} — skipping")
+ return counts
 
  # Pattern nodes
  for p in patterns:
@@ -389,7 +434,7 @@ def materialize_neo4j(
 # Cleanup: remove rows no longer in source
 # ---------------------------------------------------------------------------
 def cleanup_stale_rows(
- conn: psycopg.Connection,
+ cur: psycopg.Cursor,
  patterns: list[dict],
  doc_to_pattern: dict[str, str],
  dry_run: bool = False,
@@ -400,12 +445,35 @@ def cleanup_stale_rows(
 
  Order: entities → edges → patterns (FK safety).
  Each delete is scoped by metadata markers to avoid touching rows from other scripts.
- Requires a DB connection even in dry-run mode (reads current state to diff).
+ Requires a DB cursor even in dry-run mode (reads current state to diff).
+ The caller commits.
  """
  deleted = {"entities": 0, "edges": 0, "patterns": 0}
- cur = conn.cursor
 
- try:
+ # Current DB state for all three row kinds in one round-trip, tagged by kind
+ cur.execute(
+ """
+ SELECT 'entity', id, NULL, NULL FROM entity
+ WHERE metadata->>'content_type' = 'domain-pattern'
+ UNION ALL
+ SELECT 'edge', src_id, dst_id, predicate FROM pattern_edge
+ WHERE metadata->>'source' = 'pattern_v1.yaml'
+ UNION ALL
+ SELECT 'pattern', id, NULL, NULL FROM pattern
+ WHERE metadata->>'$schema' = 'pattern_registry_v1'
+ """
+ )
+ db_entity_ids: set[str] = set
+ db_edges: set[tuple[str, str, str]] = set
+ db_pattern_ids: set[str] = set
+ for kind, key, dst, pred in cur.fetchall:
+ if kind == "entity":
+ db_entity_ids.add(key)
+ elif kind == "edge":
+ db_edges.add((key, dst, pred))
+ else:
+ db_pattern_ids.add(key)
+
  # 1. Entities: content_type='domain-pattern' not in current doc set
  if not patterns_only:
  current_entity_ids = set
@@ -414,18 +482,12 @@ def cleanup_stale_rows(
  if md_file.name not in SKIP_FILES:
  current_entity_ids.add(f"dp-{md_file.stem}")
 
- cur.execute(
- "SELECT id FROM entity "
- "WHERE metadata->>'content_type' = 'domain-pattern'"
- )
- db_entity_ids = {row[0] for row in cur.fetchall}
-
- stale_entities = db_entity_ids - current_entity_ids
- for eid in sorted(stale_entities):
+ stale_entities = sorted(db_entity_ids - current_entity_ids)
+ for eid in stale_entities:
  print(f" {'[DRY]' if dry_run else ' ✗'} delete entity: {eid}")
- if not dry_run:
- cur.execute("DELETE FROM entity WHERE id = %s", (eid,))
- deleted["entities"] += 1
+ if stale_entities and not dry_run:
+ cur.execute("DELETE FROM entity WHERE id = ANY(%s)", (stale_entities,))
+ deleted["entities"] = len(stale_entities)
 
  # 2. Pattern edges: source='pattern_v1.yaml' not in current derives_from
  if not docs_only:
@@ -437,45 +499,31 @@ def cleanup_stale_rows(
  predicate = "extends" if p.get("provenance") == "1p" else "adopts"
  current_edges.add((p["id"], parent_id, predicate))
 
- cur.execute(
- "SELECT src_id, dst_id, predicate FROM pattern_edge "
- "WHERE metadata->>'source' = 'pattern_v1.yaml'"
- )
- db_edges = {(row[0], row[1], row[2]) for row in cur.fetchall}
-
- stale_edges = db_edges - current_edges
- for src, dst, pred in sorted(stale_edges):
+ stale_edges = sorted(db_edges - current_edges)
+ for src, dst, pred in stale_edges:
  print(f" {'[DRY]' if dry_run else ' ✗'} delete edge: {src} --{pred}--> {dst}")
- if not dry_run:
+ if stale_edges and not dry_run:
+ srcs, dsts, preds = (list(col) for col in zip(*stale_edges))
  cur.execute(
  "DELETE FROM pattern_edge "
- "WHERE src_id = %s AND dst_id = %s AND predicate = %s",
- (src, dst, pred),
+ "WHERE (src_id, dst_id, predicate) IN ("
+ " SELECT * FROM unnest(%s::text[], %s::text[], %s::text[])"
+ ")",
+ (srcs, dsts, preds),
  )
- deleted["edges"] += 1
+ deleted["edges"] = len(stale_edges)
 
  # 3. Patterns: schema='pattern_registry_v1' not in current YAML
  if not docs_only:
  current_pattern_ids = {p["id"] for p in patterns}
 
- cur.execute(
- "SELECT id FROM pattern "
- "WHERE metadata->>'$schema' = 'pattern_registry_v1'"
- )
- db_pattern_ids = {row[0] for row in cur.fetchall}
-
- stale_patterns = db_pattern_ids - current_pattern_ids
- for pid in sorted(stale_patterns):
+ stale_patterns = sorted(db_pattern_ids - current_pattern_ids)
+ for pid in stale_patterns:
  print(f" {'[DRY]' if dry_run else ' ✗'} delete pattern: {pid}")
- if not dry_run:
- cur.execute("DELETE FROM pattern WHERE id = %s", (pid,))
- deleted["patterns"] += 1
+ if stale_patterns and not dry_run:
+ cur.execute("DELETE FROM pattern WHERE id = ANY(%s)", (stale_patterns,))
+ deleted["patterns"] = len(stale_patterns)
 
- finally:
- cur.close
-
- if not dry_run:
- conn.commit
  return deleted
 
 
@@ -674,10 +722,21 @@ def main:
  if args.dry_run:
  print("\n*** DRY RUN — no database changes ***\n")
 
+ # Parse docs up front, while this process still has no DB connection
+ # for the forked parse workers to inherit
+ parsed_docs = parse_doc_files if not args.patterns_only else []
+
+ # Dedicated connection: the session settings below die with it.
+ stack = ExitStack
  conn = None
  if not args.dry_run:
- conn = get_db_connection
- conn.autocommit = False
+ conn = stack.enter_context(get_db_connection)
+ # The pattern/edge/entity upserts repeat the same SQL text per row:
+ # server-side prepare from the first execution, not psycopg's default 5th.
+ conn.prepare_threshold = 0
+ # One cursor and one transaction for every step: a single commit (one
+ # WAL flush) at the end, and the steps land atomically.
+ cur = stack.enter_context(conn.cursor) if conn else None
 
  # Track pattern edges for Neo4j
  neo4j_edges: list[tuple[str, str, str]] = []
@@ -686,11 +745,11 @@ def main:
  # Step 1: Patterns
  if not args.docs_only:
  print("\n--- Patterns ---")
- pattern_count = ingest_patterns(conn, patterns, dry_run=args.dry_run)
+ pattern_count = ingest_patterns(cur, patterns, dry_run=args.dry_run)
  print(f"\n Patterns: {pattern_count}")
 
  print("\n--- Pattern Edges ---")
- edge_count = create_pattern_edges(conn, patterns, dry_run=args.dry_run)
+ edge_count = create_pattern_edges(cur, patterns, dry_run=args.dry_run)
  print(f"\n Edges: {edge_count}")
 
  # Collect edges for Neo4j
@@ -704,26 +763,21 @@ def main:
  # Step 2: Doc entities
  if not args.patterns_only:
  print("\n--- Domain Pattern Documents ---")
- entity_count = ingest_doc_entities(conn, doc_to_pattern, dry_run=args.dry_run)
+ entity_count = ingest_doc_entities(cur, doc_to_pattern, parsed_docs, dry_run=args.dry_run)
  print(f"\n Entities: {entity_count}")
 
- if conn and not args.dry_run:
- conn.commit
-
  # Cleanup stale rows (needs DB connection even in dry-run for reads)
  if args.cleanup:
  print("\n--- Cleanup ---")
- cleanup_conn = conn
- if cleanup_conn is None:
- cleanup_conn = get_db_connection
+ cleanup_cur = cur
+ if cleanup_cur is None:
+ cleanup_cur = stack.enter_context(get_db_connection).cursor
  cleaned = cleanup_stale_rows(
- cleanup_conn, patterns, doc_to_pattern,
+ cleanup_cur, patterns, doc_to_pattern,
  dry_run=args.dry_run,
  patterns_only=args.patterns_only,
  docs_only=args.docs_only,
  )
- if cleanup_conn is not conn:
- cleanup_conn.close
  total = sum(cleaned.values)
  if total:
  print(f"\n Removed: {cleaned['entities']} entities, "
@@ -731,6 +785,9 @@ def main:
  else:
  print("\n Nothing to clean up")
 
+ if conn:
+ conn.commit
+
  # Step 3: Neo4j
  if not args.dry_run and not args.skip_neo4j and not args.docs_only:
  print("\n--- Neo4j Materialization ---")
@@ -756,8 +813,8 @@ def main:
  traceback.print_exc
  return 1
  finally:
- if conn:
- conn.close
+ # Closes the cursor and the dedicated connection
+ stack.close
 
 
 if __name__ == "__main__":
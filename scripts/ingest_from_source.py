@@ -22,9 +22,14 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
+import re
 import sys
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
@@ -43,41 +48,101 @@ sys.path.insert(0, str(Path(__file__).parent))
 from chunker import Chunk, chunk_markdown
 from db_utils import get_db_connection
 from entity_builder import EntityBuilder, LLMClassification
-from github_fetcher import GitHubFetcher
+from github_fetcher import FetchedFile, GitHubFetcher
 from lineage import LineageTracker, OperationType
-from source_config import SourceConfig, list_sources, load_source_config
+from llm_classifier import LLMClassifier
+from source_config import list_sources, load_source_config
 
 
 console = Console
 
+# Inputs per embeddings request. Chunks are capped at ~512 tokens, so this
+# stays well inside OpenAI's per-request input and token limits.
+EMBEDDING_BATCH_SIZE = 96
+
+# Files fetched/chunked/classified ahead of the (single-threaded) DB writer.
+# Worker count comes from llm_classify.concurrency, since classification
+# dominates preparation time.
+PIPELINE_DEPTH = 32
+
 
 def classify_content(
  content: str,
- config: SourceConfig,
+ classifier: Optional[LLMClassifier],
 ) -> Optional[LLMClassification]:
  """
  Classify content using LLM if enabled.
 
  Args:
  content: Markdown content
- config: Source configuration
+ classifier: Classifier shared across the run (None if disabled)
 
  Returns:
  LLMClassification or None if classification disabled
  """
- if not config.llm_classify.enabled:
+ if classifier is None:
  return None
 
- from llm_classifier import LLMClassifier
-
  try:
- classifier = LLMClassifier(model=config.llm_classify.model)
  return classifier.classify(content)
  except Exception as e:
  console.print(f"[yellow]Warning: LLM classification failed: {e}[/yellow]")
  return None
 
 
+def prepare_files(
+ fetcher: GitHubFetcher,
+ files: list[str],
+ classifier: Optional[LLMClassifier],
+ max_workers: int = 4,
+) -> Iterator[tuple[str, tuple[FetchedFile, list[Chunk], Optional[LLMClassification]] | Exception]]:
+ """
+ Fetch, chunk and classify files ahead of the consumer.
+
+ Fetches run in the fetcher's thread pool; chunking and classification run
+ in a second pool as fetches complete, so LLM latency overlaps with both
+ the next fetches and the caller's DB/embedding work. At most
+ PIPELINE_DEPTH prepared files are held at once, plus the fetcher's own
+ bounded window of fetched-but-unconsumed files.
+
+ Args:
+ fetcher: GitHub fetcher
+ files: File paths to ingest
+ classifier: Classifier shared across the run (None if disabled)
+ max_workers: Maximum concurrent preparations (and so LLM requests)
+
+ Yields:
+ (path, (fetched, chunks, classification)) or (path, exception), in file order
+ """
+
+ def prepare(fetched: FetchedFile):
+ chunks = chunk_markdown(fetched.content)
+ classification = classify_content(fetched.content, classifier)
+ return fetched, chunks, classification
+
+ def result(file_path: str, future: Future):
+ try:
+ return file_path, future.result
+ except Exception as e:
+ return file_path, e
+
+ pending: deque[tuple[str, Future]] = deque
+ with ThreadPoolExecutor(max_workers=max_workers) as executor:
+ for file_path, fetched in fetcher.fetch_files(files):
+ if isinstance(fetched, Exception):
+ future = Future
+ future.set_exception(fetched)
+ else:
+ future = executor.submit(prepare, fetched)
+ pending.append((file_path, future))
+
+ if len(pending) >= PIPELINE_DEPTH:
+ yield result(*pending.popleft)
+
+ while pending:
+ yield result(*pending.popleft)
+
+
 def ingest_entity(
  entity: dict,
  conn: psycopg.Connection,
@@ -141,7 +206,7 @@ def ingest_entity(
 
 def ingest_chunks(
  entity_id: str,
- content: str,
+ chunks: list[Chunk],
  source_file: str,
  corpus: str | None,
  content_type: str | None,
@@ -150,11 +215,11 @@ def ingest_chunks(
  dry_run: bool = False,
 ) -> int:
  """
- Chunk content and insert into document_chunk table with OpenAI embeddings.
+ Insert chunks into document_chunk table with OpenAI embeddings.
 
  Args:
  entity_id: Parent entity ID (FK)
- content: Raw markdown content to chunk
+ chunks: Chunks from chunk_markdown (parsed once per file by the caller)
  source_file: Source file path/URI
  corpus: Corpus tag from entity metadata
  content_type: Content type from entity metadata
@@ -165,138 +230,254 @@ def ingest_chunks(
  Returns:
  Number of chunks inserted
  """
- chunks = chunk_markdown(content)
  if not chunks or dry_run:
  return len(chunks)
 
  cursor = conn.cursor
 
+ # Pipeline the DELETE with the cache lookup/upsert so they share round
+ # trips. COPY isn't allowed in pipeline mode, so it runs after the block.
+ with conn.pipeline:
  # Delete existing chunks for this entity (idempotent re-ingestion)
  cursor.execute(
  "DELETE FROM document_chunk WHERE entity_id = %s",
  (entity_id,),
  )
 
- from generate_embeddings import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+ embeddings = _cached_embeddings(cursor, openai_client, [chunk.content for chunk in chunks])
 
- for chunk in chunks:
- # Generate embedding via OpenAI
- try:
- resp = openai_client.embeddings.create(
- model=EMBEDDING_MODEL,
- input=chunk.content,
- dimensions=EMBEDDING_DIMENSIONS,
- )
- embedding = resp.data[0].embedding
- except Exception:
- embedding = None
-
- cursor.execute(
+ # Stream all rows in one COPY instead of an INSERT round-trip per chunk.
+ # COPY text input takes pgvector's '[x,y,...]' literal for the embedding.
+ with cursor.copy(
  """
- INSERT INTO document_chunk (
+ COPY document_chunk (
  source_file, heading_hierarchy, content,
  chunk_index, total_chunks, char_count, approx_tokens,
  embedding, entity_id, corpus, content_type
- ) VALUES (
- %(source_file)s, %(hierarchy)s, %(content)s,
- %(chunk_index)s, %(total_chunks)s, %(char_count)s, %(approx_tokens)s,
- %(embedding)s, %(entity_id)s, %(corpus)s, %(content_type)s
+ ) FROM STDIN
+ """
+ ) as copy:
+ for chunk, embedding in zip(chunks, embeddings):
+ copy.write_row(
+ (
+ source_file,
+ chunk.heading_hierarchy,
+ chunk.content,
+ chunk.chunk_index,
+ chunk.total_chunks,
+ chunk.char_count,
+ chunk.approx_tokens,
+ embedding,
+ entity_id,
+ corpus,
+ content_type,
  )
- """,
- {
- "source_file": source_file,
- "hierarchy": chunk.heading_hierarchy,
- "content": chunk.content,
- "chunk_index": chunk.chunk_index,
- "total_chunks": chunk.total_chunks,
- "char_count": chunk.char_count,
- "approx_tokens": chunk.approx_tokens,
- "embedding": embedding,
- "entity_id": entity_id,
- "corpus": corpus,
- "content_type": content_type,
- },
  )
 
  return len(chunks)
 
 
+# Cleared when chunk_embedding_cache is missing (migration 003 not applied)
+_chunk_cache_enabled = True
+
+
+def _embedding_literal(embedding: list[float]) -> str:
+ return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+def _cached_embeddings(
+ cursor: psycopg.Cursor,
+ openai_client,
+ texts: list[str],
+) -> list[str | None]:
+ """
+ Get embeddings for texts, calling OpenAI only for cache misses.
+
+ chunk_embedding_cache is keyed by (model, dimensions, sha256(text)), so
+ unchanged chunks are never re-embedded on re-ingestion. Embeddings are
+ returned as pgvector '[x,y,...]' literals, ready for COPY.
+
+ The cache work runs in a savepoint: on a database without the cache
+ table it rolls back alone, the cache is switched off for the rest of the
+ run, and every text is embedded directly.
+
+ Returns:
+ One embedding literal (or None on failure) per input text, in order
+ """
+ global _chunk_cache_enabled
+ if not _chunk_cache_enabled:
+ return _uncached_embeddings(openai_client, texts)
+
+ from generate_embeddings import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+
+ keys = [hashlib.sha256(text.encode).hexdigest for text in texts]
+ try:
+ with cursor.connection.transaction:
+ cursor.execute(
+ """
+ SELECT key, embedding::text FROM chunk_embedding_cache
+ WHERE model = %s AND dimensions = %s AND key = ANY(%s)
+ """,
+ (EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, keys),
+ )
+ cached = dict(cursor.fetchall)
+
+ # Keyed by hash, so repeated chunks (boilerplate, nav blocks) are embedded once
+ misses = {key: text for key, text in zip(keys, texts) if key not in cached}
+ if misses:
+ rows = []
+ fresh = _embed_texts(openai_client, list(misses.values))
+ for key, embedding in zip(misses, fresh):
+ if embedding is None:
+ continue
+ cached[key] = _embedding_literal(embedding)
+ rows.append((key, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, cached[key]))
+ if rows:
+ cursor.executemany(
+ """
+ INSERT INTO chunk_embedding_cache (key, model, dimensions, embedding)
+ VALUES (%s, %s, %s, %s::vector)
+ ON CONFLICT (model, dimensions, key) DO NOTHING
+ """,
+ rows,
+ )
+ except psycopg.errors.UndefinedTable:
+ _chunk_cache_enabled = False
+ console.print(
+ "[yellow]Warning: chunk_embedding_cache not found; embedding without cache "
+ "(apply schemas/migrations/003_chunk_embedding_cache.sql)[/yellow]"
+ )
+ return _uncached_embeddings(openai_client, texts)
+
+ return [cached.get(key) for key in keys]
+
+
+def _uncached_embeddings(openai_client, texts: list[str]) -> list[str | None]:
+ return [
+ _embedding_literal(embedding) if embedding is not None else None
+ for embedding in _embed_texts(openai_client, texts)
+ ]
+
+
+def _embed_texts(openai_client, texts: list[str]) -> list[list[float] | None]:
+ """
+ Embed texts with as few OpenAI requests as possible.
+
+ Sends up to EMBEDDING_BATCH_SIZE inputs per request (results come back in
+ input order). If a batch request fails, its items are retried one at a
+ time so a single bad input only loses its own embedding.
+
+ Returns:
+ One embedding (or None on failure) per input text, in order
+ """
+ from generate_embeddings import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+
+ embeddings: list[list[float] | None] = []
+ for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+ batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+ try:
+ resp = openai_client.embeddings.create(
+ model=EMBEDDING_MODEL,
+ input=batch,
+ dimensions=EMBEDDING_DIMENSIONS,
+ )
+ embeddings.extend(item.embedding for item in resp.data)
+ except Exception:
+ for text in batch:
+ try:
+ resp = openai_client.embeddings.create(
+ model=EMBEDDING_MODEL,
+ input=text,
+ dimensions=EMBEDDING_DIMENSIONS,
+ )
+ embeddings.append(resp.data[0].embedding)
+ except Exception:
+ embeddings.append(None)
+ return embeddings
+
+
 def materialize_edges_neo4j(
  entity: dict,
+ session,
 ) -> int:
  """
  Write entity and its detected_edges to Neo4j.
 
+ Edges are sent as parameter lists and UNWINDed server-side: one statement
+ per distinct predicate instead of one request per edge, and no Cypher
+ built from entity/edge strings.
+
  Args:
  entity: Entity dictionary with metadata containing detected_edges
+ session: Neo4j session (reused across the whole run)
 
  Returns:
  Number of edges materialized
  """
- import subprocess
-
  metadata = entity.get("metadata", {})
  edges = metadata.get("detected_edges", [])
  entity_id = entity["id"]
- title = entity.get("title", "")
- corpus = metadata.get("corpus", "")
- ct = metadata.get("content_type", "")
 
  # Create/update source node
- cypher = (
- f"MERGE (n:Entity {{id: '{entity_id}'}}) "
- f"SET n.title = '{_neo4j_escape(title)}', "
- f"n.corpus = '{_neo4j_escape(corpus)}', "
- f"n.content_type = '{_neo4j_escape(ct)}'"
- )
- _run_cypher(cypher)
-
- count = 0
+ session.run(
+ "MERGE (n:Entity {id: $id}) "
+ "SET n.title = $title, n.corpus = $corpus, n.content_type = $content_type",
+ id=entity_id,
+ title=entity.get("title", ""),
+ corpus=metadata.get("corpus", ""),
+ content_type=metadata.get("content_type", ""),
+ ).consume
+
+ # Relationship types can't be parameterized, so group rows by predicate
+ rows_by_predicate: dict[str, list[dict]] = {}
  for edge in edges:
  target = edge.get("target_concept", "")
- predicate = edge.get("predicate", "related_to").upper.replace(" ", "_")
- strength = edge.get("strength", 0.5)
- rationale = _neo4j_escape(edge.get("rationale", ""))
-
  if not target:
  continue
+ predicate = REL_TYPE_INVALID_CHARS.sub("_", edge.get("predicate", "related_to").upper)
+ rows_by_predicate.setdefault(predicate, []).append({
+ "target": target,
+ "strength": edge.get("strength", 0.5),
+ "rationale": edge.get("rationale", ""),
+ })
 
- cypher = (
- f"MERGE (s:Entity {{id: '{entity_id}'}}) "
- f"MERGE (t:Concept {{id: '{target}'}}) "
- f"MERGE (s)-[r:{predicate}]->(t) "
- f"SET r.strength = {strength}, r.rationale = '{rationale}'"
- )
- _run_cypher(cypher)
- count += 1
+ count = 0
+ for predicate, rows in rows_by_predicate.items:
+ session.run(
+ "MATCH (s:Entity {id: $id}) "
+ "UNWIND $rows AS r "
+ "MERGE (t:Concept {id: r.target}) "
+ f"MERGE (s)-[rel:{predicate}]->(t) "
+ "SET rel.strength = r.strength, rel.rationale = r.rationale",
+ id=entity_id,
+ rows=rows,
+ ).consume
+ count += len(rows)
 
  return count
 
 
-def _neo4j_escape(s: str) -> str:
- """Escape single quotes for Neo4j Cypher."""
- return s.replace("\\", "\\\\").replace("'", "\\'")
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "") # Empty for no auth
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "")
 
+# Anything outside [A-Z0-9_] can't appear in an unquoted relationship type
+REL_TYPE_INVALID_CHARS = re.compile(r"[^A-Z0-9_]")
 
-NEO4J_URL = os.environ.get("NEO4J_URL", "http://localhost:7474")
+_neo4j_driver = None
 
 
-def _run_cypher(cypher: str) -> bool:
- """Execute a Cypher statement against Neo4j HTTP API."""
- import subprocess
+def _get_neo4j_driver:
+ """Get the module-level Bolt driver (created on first use; it pools connections)."""
+ global _neo4j_driver
+ if _neo4j_driver is None:
+ from neo4j import GraphDatabase
 
- result = subprocess.run(
- [
- "curl", "-s", "-o", "/dev/null", "-w", "%{http_code}",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"statements": [{"statement": cypher}]}),
- f"{NEO4J_URL}/db/neo4j/tx/commit",
- ],
- capture_output=True,
- text=True,
- timeout=10,
- )
- return result.stdout.strip == "200"
+ auth = None
+ if NEO4J_USER and NEO4J_PASSWORD:
+ auth = (NEO4J_USER, NEO4J_PASSWORD)
+ _neo4j_driver = GraphDatabase.driver(NEO4J_URI, auth=auth)
+ return _neo4j_driver
 
 
 def run_ingestion(
@@ -389,6 +570,19 @@ def run_ingestion(
  except Exception as e:
  console.print(f"[yellow]Warning: OpenAI client init failed (chunks won't get embeddings): {e}[/yellow]")
 
+ # One Bolt session for all graph writes in this run
+ neo4j_session = None
+ if not dry_run:
+ neo4j_session = _get_neo4j_driver.session
+
+ # One classifier (and API client) for the whole run
+ classifier = None
+ if config.llm_classify.enabled:
+ try:
+ classifier = LLMClassifier(model=config.llm_classify.model)
+ except Exception as e:
+ console.print(f"[yellow]Warning: LLM classifier init failed (files won't be classified): {e}[/yellow]")
+
  # Process files
  builder = EntityBuilder(config)
  results = []
@@ -419,18 +613,21 @@ def run_ingestion(
  ) as progress:
  task = progress.add_task("Processing...", total=len(files))
 
- for file_path in files:
+ # Fetch/chunk/classify run concurrently ahead of processing;
+ # DB writes stay on this thread, in file order.
+ for file_path, prepared in prepare_files(
+ fetcher, files, classifier, max_workers=config.llm_classify.concurrency
+ ):
  progress.update(task, description=f"Processing {Path(file_path).name}...")
 
  try:
- # Fetch file
- fetched = fetcher.fetch_file(file_path)
+ if isinstance(prepared, Exception):
+ raise prepared
 
- # Build entity
- classification = None
- if config.llm_classify.enabled:
- classification = classify_content(fetched.content, config)
+ # Markdown is chunked once; chunks are reused below
+ fetched, chunks, classification = prepared
 
+ # Build entity
  entity = builder.build(fetched, classification)
 
  # Insert into database
@@ -473,7 +670,7 @@ def run_ingestion(
  try:
  chunk_count = ingest_chunks(
  entity_id=entity["id"],
- content=fetched.content,
+ chunks=chunks,
  source_file=file_path,
  corpus=entity["metadata"].get("corpus"),
  content_type=entity["metadata"].get("content_type"),
@@ -489,7 +686,7 @@ def run_ingestion(
  edge_count = 0
  if success and not dry_run:
  try:
- edge_count = materialize_edges_neo4j(entity)
+ edge_count = materialize_edges_neo4j(entity, neo4j_session)
  total_edges += edge_count
  except Exception as e:
  console.print(f"[yellow]Graph materialization failed for {entity['id']}: {e}[/yellow]")
@@ -523,6 +720,9 @@ def run_ingestion(
 
  progress.advance(task)
 
+ if neo4j_session:
+ neo4j_session.close
+
  # Commit transaction
  if conn and not dry_run:
  try:
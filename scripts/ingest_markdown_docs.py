@@ -36,6 +36,7 @@ import argparse
 import json
 import re
 import sys
+from collections.abc import Iterator
 from datetime import datetime, UTC
 from pathlib import Path
 from typing import Optional
@@ -62,6 +63,25 @@ CATEGORY_MAP = {
  "examples-analogies": "examples",
 }
 
+# Compiled once; these run for every file in the corpus
+H1_PATTERN = re.compile(r"^#\s+(.+)$", re.MULTILINE)
+FRONTMATTER_PATTERN = re.compile(r"^---\s*\n.*?\n---\s*\n", re.DOTALL)
+LINK_PATTERN = re.compile(r"\[([^\]]+)\]\([^\)]+\)")
+BOLD_PATTERN = re.compile(r"\*\*([^\*]+)\*\*")
+ITALIC_PATTERN = re.compile(r"\*([^\*]+)\*")
+CODE_PATTERN = re.compile(r"`([^`]+)`")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Conceptual keywords tagged when they appear anywhere in a doc (simple heuristic).
+# One case-insensitive pass over the content; the lookahead makes matches
+# overlap, so "AI" is still found inside "DOMAIN" as with a substring test.
+TAG_KEYWORDS = ("DIKW", "DDD", "Knowledge", "Semantic", "AI", "Data", "Domain")
+TAG_BY_KEYWORD = {k.upper: k.lower for k in TAG_KEYWORDS}
+TAG_KEYWORD_PATTERN = re.compile(
+ "(?=(" + "|".join(re.escape(k) for k in TAG_KEYWORDS) + "))",
+ re.IGNORECASE,
+)
+
 
 def parse_frontmatter(content: str) -> tuple[Optional[dict], str]:
  """
@@ -106,7 +126,7 @@ def extract_title(content: str, filename: str) -> str:
  Extracted title
  """
  # Try to find H1 header (# Title)
- h1_match = re.search(r"^#\s+(.+)$", content, re.MULTILINE)
+ h1_match = H1_PATTERN.search(content)
  if h1_match:
  return h1_match.group(1).strip
 
@@ -127,20 +147,20 @@ def extract_description(content: str, max_length: int = 500) -> Optional[str]:
  First paragraph as description, or None
  """
  # Remove frontmatter if present
- content_no_frontmatter = re.sub(r"^---\s*\n.*?\n---\s*\n", "", content, flags=re.DOTALL)
+ content_no_frontmatter = FRONTMATTER_PATTERN.sub("", content)
 
  # Remove H1 title
- content_no_title = re.sub(r"^#\s+.+$", "", content_no_frontmatter, count=1, flags=re.MULTILINE)
+ content_no_title = H1_PATTERN.sub("", content_no_frontmatter, count=1)
 
  # Find first non-empty paragraph
  paragraphs = [p.strip for p in content_no_title.split("\n\n") if p.strip]
  if paragraphs:
  desc = paragraphs[0]
  # Remove markdown formatting
- desc = re.sub(r"\[([^\]]+)\]\([^\)]+\)", r"\1", desc) # Links
- desc = re.sub(r"\*\*([^\*]+)\*\*", r"\1", desc) # Bold
- desc = re.sub(r"\*([^\*]+)\*", r"\1", desc) # Italic
- desc = re.sub(r"`([^`]+)`", r"\1", desc) # Code
+ desc = LINK_PATTERN.sub(r"\1", desc) # Links
+ desc = BOLD_PATTERN.sub(r"\1", desc) # Bold
+ desc = ITALIC_PATTERN.sub(r"\1", desc) # Italic
+ desc = CODE_PATTERN.sub(r"\1", desc) # Code
 
  if len(desc) > max_length:
  desc = desc[:max_length].rsplit(" ", 1)[0] + "..."
@@ -165,26 +185,25 @@ def extract_tags(content: str, directory: str) -> list[str]:
  if directory in CATEGORY_MAP:
  tags.append(CATEGORY_MAP[directory])
 
- # Extract common conceptual keywords from content (simple heuristic)
- keywords = ["DIKW", "DDD", "Knowledge", "Semantic", "AI", "Data", "Domain"]
- content_upper = content.upper
- for keyword in keywords:
- if keyword.upper in content_upper:
- tags.append(keyword.lower)
+ # Extract common conceptual keywords from content
+ matched = {match.group(1) for match in TAG_KEYWORD_PATTERN.finditer(content)}
+ tags.extend(TAG_BY_KEYWORD[keyword.upper] for keyword in matched)
 
  return list(set(tags)) # Deduplicate
 
 
-def build_filespec(file_path: Path) -> dict:
+def build_filespec(file_path: Path, stat: Optional[os.stat_result] = None) -> dict:
  """
  Build filespec_v1 JSONB object.
 
  Args:
  file_path: Path to markdown file
+ stat: Pre-fetched stat result (from walk_md_files); stat'ed here if None
 
  Returns:
  Filespec dictionary
  """
+ if stat is None:
  stat = file_path.stat
  return {
  "filename": file_path.name,
@@ -205,7 +224,7 @@ def build_content_metadata(content: str) -> dict:
  Returns:
  Content metadata dictionary
  """
- word_count = len(re.findall(r"\w+", content))
+ word_count = sum(1 for _ in WORD_PATTERN.finditer(content))
  return {
  "word_count": word_count,
  "format": "markdown",
@@ -213,11 +232,32 @@ def build_content_metadata(content: str) -> dict:
  }
 
 
+def walk_md_files(root: Path) -> Iterator[tuple[Path, os.stat_result]]:
+ """
+ Recursively find markdown files under root with os.scandir.
+
+ Cheaper than Path.rglob on large trees, and the DirEntry stat is kept
+ so build_filespec doesn't stat each file again.
+
+ Yields:
+ (path, stat) for every *.md file (directory symlinks are not followed)
+ """
+ stack = [str(root)]
+ while stack:
+ with os.scandir(stack.pop) as entries:
+ for entry in entries:
+ if entry.is_dir(follow_symlinks=False):
+ stack.append(entry.path)
+ elif entry.name.endswith(".md") and entry.is_file:
+ yield Path(entry.path), entry.stat
+
+
 def ingest_markdown_file(
  file_path: Path,
  cursor: psycopg.Cursor,
  dry_run: bool = False,
  entity_id_map: Optional[dict] = None,
+ stat: Optional[os.stat_result] = None,
 ) -> dict:
  """
  Ingest a single markdown file into Entity table.
@@ -230,6 +270,7 @@ def ingest_markdown_file(
  cursor: Database cursor
  dry_run: If True, don't insert into database
  entity_id_map: Dict mapping filenames to entity_ids for relationship resolution
+ stat: Pre-fetched stat result for the file, if the caller has one
 
  Returns:
  Dictionary of derived attributes for logging
@@ -252,7 +293,7 @@ def ingest_markdown_file(
  auto_category = CATEGORY_MAP.get(directory, "uncategorized")
 
  # Build JSONB objects
- filespec = build_filespec(file_path)
+ filespec = build_filespec(file_path, stat)
  content_metadata = build_content_metadata(content_body)
 
  # Merge frontmatter with auto-derived (frontmatter wins)
@@ -332,24 +373,20 @@ def ingest_markdown_file(
 def create_edge_relationships(
  relationships: list[dict],
  source_entity_id: str,
- cursor: psycopg.Cursor,
  entity_id_map: dict,
- dry_run: bool = False,
-) -> int:
+) -> list[tuple]:
  """
- Create Edge relationships from frontmatter relationship definitions.
+ Resolve frontmatter relationship definitions into edge rows.
 
  Args:
  relationships: List of relationship dicts from frontmatter
  source_entity_id: Source entity ID
- cursor: Database cursor
  entity_id_map: Map of filenames to entity IDs
- dry_run: If True, don't insert
 
  Returns:
- Number of edges created
+ (edge_id, source_id, destination_id, predicate, strength) rows for insert_edges
  """
- edges_created = 0
+ rows = []
 
  for rel in relationships:
  predicate = rel.get("predicate")
@@ -373,22 +410,39 @@ def create_edge_relationships(
  print(f" Warning: Relationship missing target_id or target_file", file=sys.stderr)
  continue
 
- if not dry_run:
- edge_id = uuid4
+ rows.append((uuid4, source_entity_id, destination_id, predicate, strength))
+
+ return rows
+
+
+def insert_edges(cursor: psycopg.Cursor, rows: list[tuple]) -> None:
+ """
+ Bulk-insert edge rows: COPY into a temp staging table, then one
+ INSERT ... SELECT so ON CONFLICT DO NOTHING still applies.
+
+ Args:
+ cursor: Database cursor (inside the ingestion transaction)
+ rows: Rows from create_edge_relationships
+ """
  cursor.execute(
  """
- INSERT INTO edge (
- edge_id, source_id, destination_id, predicate, strength
- ) VALUES (
- %s, %s, %s, %s, %s
+ CREATE TEMP TABLE edge_stage ON COMMIT DROP AS
+ SELECT edge_id, source_id, destination_id, predicate, strength
+ FROM edge WITH NO DATA
+ """
  )
+ with cursor.copy(
+ "COPY edge_stage (edge_id, source_id, destination_id, predicate, strength) FROM STDIN"
+ ) as copy:
+ for row in rows:
+ copy.write_row(row)
+ cursor.execute(
+ """
+ INSERT INTO edge (edge_id, source_id, destination_id, predicate, strength)
+ SELECT edge_id, source_id, destination_id, predicate, strength FROM edge_stage
  ON CONFLICT DO NOTHING
- """,
- (edge_id, source_entity_id, destination_id, predicate, strength),
+ """
  )
- edges_created += 1
-
- return edges_created
 
 
 def main:
@@ -413,7 +467,7 @@ def main:
  sys.exit(1)
 
  # Find all markdown files
- md_files = sorted(docs_path.rglob("*.md"))
+ md_files = sorted(walk_md_files(docs_path), key=lambda item: item[0])
  print(f"Found {len(md_files)} markdown files in {docs_path}\n")
 
  if args.dry_run:
@@ -438,9 +492,9 @@ def main:
  entity_relationships = {} # entity_id -> relationships
  ingested_count = 0
 
- for md_file in md_files:
+ for md_file, stat in md_files:
  try:
- result = ingest_markdown_file(md_file, cursor, dry_run=args.dry_run)
+ result = ingest_markdown_file(md_file, cursor, dry_run=args.dry_run, stat=stat)
 
  # Track entity ID by filename for relationship resolution
  entity_id_map[md_file.name] = result["entity_id"]
@@ -465,21 +519,19 @@ def main:
  # PASS 2: Create relationships
  if entity_relationships:
  print(f"\n=== PASS 2: Creating Relationships ===\n")
- total_edges = 0
+ edge_rows = []
 
  for entity_id, relationships in entity_relationships.items:
- edges_created = create_edge_relationships(
- relationships,
- entity_id,
- cursor,
- entity_id_map,
- dry_run=args.dry_run,
- )
- if edges_created > 0:
- print(f"✓ Created {edges_created} edges for entity {entity_id}")
- total_edges += edges_created
+ rows = create_edge_relationships(relationships, entity_id, entity_id_map)
+ if rows:
+ print(f"✓ Created {len(rows)} edges for entity {entity_id}")
+ edge_rows.extend(rows)
+
+ # One COPY + INSERT ... SELECT for every edge in the corpus
+ if edge_rows and not args.dry_run:
+ insert_edges(cursor, edge_rows)
 
- print(f"\nTotal edges created: {total_edges}")
+ print(f"\nTotal edges created: {len(edge_rows)}")
 
  # Commit transaction
  if conn and not args.dry_run:
@@ -9,12 +9,44 @@ Usage:
  python scripts/init_schema.py
 """
 
+import hashlib
 import os
+import re
 import sys
 import time
-import psycopg2
+import psycopg
 from pathlib import Path
 
+from db_utils import read_env_file
+
+# Tokens that may contain a ';' that does not end a statement, plus the ';'
+# itself. Dollar-quoted bodies ($$ ... $$, $fn$ ... $fn$) match as a whole.
+SQL_TOKEN_PATTERN = re.compile(
+ r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$[A-Za-z_]*\$).*?\1|;",
+ re.DOTALL,
+)
+# Whitespace and comments ahead of a statement's first keyword
+SQL_LEADING_PATTERN = re.compile(r"(?:\s+|--[^\n]*|/\*.*?\*/)*", re.DOTALL)
+
+
+def split_statements(sql):
+ """Split a SQL script into (line number, statement) pairs, one per statement."""
+ statements = []
+ start = 0
+
+ def add(end):
+ lead = SQL_LEADING_PATTERN.match(sql, start, end).end
+ statement = sql[lead:end].strip
+ if statement:
+ statements.append((sql.count("\n", 0, lead) + 1, statement))
+
+ for match in SQL_TOKEN_PATTERN.finditer(sql):
+ if match.group == ";":
+ add(match.start)
+ start = match.end
+ add(len(sql))
+ return statements
+
 def load_env:
  """Load required environment variables from .env file."""
  env_file = Path(".env")
@@ -22,13 +54,9 @@ def load_env:
  print("✗ Error: .env file not found!")
  sys.exit(1)
 
- env_vars = {}
- with open(env_file) as f:
- for line in f:
- line = line.strip
- if line and not line.startswith('#') and '=' in line:
- key, value = line.split('=', 1)
- env_vars[key.strip] = value.strip
+ env_vars = read_env_file(env_file.resolve)
+ for key, value in env_vars.items:
+ os.environ.setdefault(key, value)
 
  # Check required variables
  required = ['POSTGRES_PASSWORD', 'POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER']
@@ -46,11 +74,11 @@ def wait_for_postgres(config, max_attempts=30):
 
  for attempt in range(max_attempts):
  try:
- conn = psycopg2.connect(**config)
+ conn = psycopg.connect(**config)
  conn.close
  print("✓ PostgreSQL is ready!")
  return True
- except psycopg2.OperationalError:
+ except psycopg.OperationalError:
  if attempt < max_attempts - 1:
  print(f" Attempt {attempt + 1}/{max_attempts}: waiting...")
  time.sleep(2)
@@ -71,11 +99,44 @@ def run_schema(conn, schema_path):
  with open(schema_path) as f:
  schema_sql = f.read
 
+ # Applied schema files are recorded in schema_version by content hash
+ schema_hash = f"sha256:{hashlib.sha256(schema_sql.encode).hexdigest}"
+
  try:
  cursor = conn.cursor
 
+ cursor.execute("SELECT to_regclass('schema_version')")
+ if cursor.fetchone[0] is not None:
+ cursor.execute(
+ "SELECT 1 FROM schema_version WHERE version = %s LIMIT 1",
+ (schema_hash,),
+ )
+ if cursor.fetchone:
+ print(f"✓ Schema already at version {schema_hash} — nothing to do")
+ cursor.close
+ return True
+
  print("⚙️ Running Phase 1 schema...")
- cursor.execute(schema_sql)
+ statements = split_statements(schema_sql)
+ try:
+ # One network flush for the whole file instead of a round trip per statement
+ with conn.pipeline:
+ for _, statement in statements:
+ cursor.execute(statement)
+ except psycopg.Error:
+ # Pipeline errors surface at sync; replay unpipelined to find the statement
+ conn.rollback
+ lineno, error = find_failing_statement(conn, statements)
+ print(f"✗ Error at {schema_path}:{lineno}: {error}")
+ conn.rollback
+ cursor.close
+ return False
+
+ cursor.execute(
+ "INSERT INTO schema_version (version, description) VALUES (%s, %s) "
+ "ON CONFLICT (version) DO NOTHING",
+ (schema_hash, f"{schema_path.name} applied by init_schema.py"),
+ )
  conn.commit
 
  print("✓ Phase 1 schema installed successfully!")
@@ -98,6 +159,7 @@ def run_schema(conn, schema_path):
  cursor.execute("""
  SELECT version, description, applied_at
  FROM schema_version
+ WHERE version NOT LIKE 'sha256:%'
  ORDER BY applied_at DESC
  LIMIT 1
  """)
@@ -116,6 +178,16 @@ def run_schema(conn, schema_path):
  conn.rollback
  return False
 
+def find_failing_statement(conn, statements):
+ """Execute statements one at a time; return (line number, error) of the first failure."""
+ with conn.cursor as cursor:
+ for lineno, statement in statements:
+ try:
+ cursor.execute(statement)
+ except psycopg.Error as e:
+ return lineno, e
+ return None, "statement failed only when pipelined"
+
 def show_examples:
  """Show example queries and next steps."""
  print("\n" + "="*70)
@@ -181,7 +253,7 @@ def main:
  db_config = {
  'host': env.get('POSTGRES_HOST', 'localhost'),
  'port': int(env.get('POSTGRES_PORT', 5432)),
- 'database': env.get('POSTGRES_DB', 'postgres'),
+ 'dbname': env.get('POSTGRES_DB', 'postgres'),
  'user': env.get('POSTGRES_USER', 'postgres'),
  'password': env['POSTGRES_PASSWORD']
  }
@@ -197,7 +269,7 @@ def main:
  # Connect
  print("\n🔌 Connecting to PostgreSQL...")
  try:
- conn = psycopg2.connect(**db_config)
+ conn = psycopg.connect(**db_config)
  print("✓ Connected to PostgreSQL")
  except Exception as e:
  print(f"✗ Connection failed: {e}")
@@ -16,8 +16,10 @@ Usage:
 
 from __future__ import annotations
 
-import functools
-from typing import Any, Callable, TypeVar
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Generator, TypeVar
 
 from .episode import Episode, OperationType, TargetType
 from .tracker import LineageTracker, create_standalone_episode
@@ -25,41 +27,44 @@ from .tracker import LineageTracker, create_standalone_episode
 F = TypeVar("F", bound=Callable[..., Any])
 
 
+_tracker_var: ContextVar[LineageTracker | None] = ContextVar("lineage_tracker", default=None)
+_episode_var: ContextVar[Episode | None] = ContextVar("lineage_episode", default=None)
+
+
 class LineageContext:
  """
- Thread-local context for lineage tracking.
+ Per-context (thread / asyncio task) state for lineage tracking.
 
  Allows nested operations to share a tracker and add context to episodes.
+ Backed by ContextVars, so concurrent pipelines don't see each other's
+ episode.
  """
 
- _current_tracker: LineageTracker | None = None
- _current_episode: Episode | None = None
+ @staticmethod
+ def set_tracker(tracker: LineageTracker | None) -> Token:
+ """Set the current tracker for this context."""
+ return _tracker_var.set(tracker)
 
- @classmethod
- def set_tracker(cls, tracker: LineageTracker) -> None:
- """Set the current tracker for this thread."""
- cls._current_tracker = tracker
+ @staticmethod
+ def get_tracker -> LineageTracker | None:
+ """Get the current tracker for this context."""
+ return _tracker_var.get
 
- @classmethod
- def get_tracker(cls) -> LineageTracker | None:
- """Get the current tracker for this thread."""
- return cls._current_tracker
+ @staticmethod
+ def set_episode(episode: Episode | None) -> Token:
+ """Set the current episode for this context (reset with the returned token)."""
+ return _episode_var.set(episode)
 
- @classmethod
- def set_episode(cls, episode: Episode) -> None:
- """Set the current episode for this thread."""
- cls._current_episode = episode
+ @staticmethod
+ def get_episode -> Episode | None:
+ """Get the current episode for this context."""
+ return _episode_var.get
 
- @classmethod
- def get_episode(cls) -> Episode | None:
- """Get the current episode for this thread."""
- return cls._current_episode
-
- @classmethod
- def clear(cls) -> None:
+ @staticmethod
+ def clear -> None:
  """Clear the current context."""
- cls._current_tracker = None
- cls._current_episode = None
+ _tracker_var.set(None)
+ _episode_var.set(None)
 
 
 def emit_lineage(
@@ -95,54 +100,75 @@ def emit_lineage(
  """
 
  def decorator(func: F) -> F:
- @functools.wraps(func)
+ # Resolve the target_id argument position once, not per call
+ target_idx: int | None = _param_index(func, target_id_param)
+ name: str = agent_name or func.__name__
+
  def wrapper(*args: Any, **kwargs: Any) -> Any:
+ target_id: Any
+ tracker: LineageTracker | None
+ episode: Episode
+ token: Token
+ result: Any
+
  # Get target_id from args/kwargs
- target_id = _extract_param(func, target_id_param, args, kwargs)
+ if target_id_param in kwargs:
+ target_id = kwargs[target_id_param]
+ elif target_idx is not None and target_idx < len(args):
+ target_id = args[target_idx]
+ else:
+ target_id = None
  if target_id is None:
  # If we can't find the target_id, just run the function without tracking
  return func(*args, **kwargs)
 
- # Get or create tracker
+ # Use the context's tracker if there is one, else a standalone episode
  tracker = LineageContext.get_tracker
-
  if tracker is not None:
- # Use existing tracker from context
- with tracker.track_operation(
+ episode_cm = tracker.track_operation(
  operation=operation,
  target_type=target_type,
  target_id=target_id,
- ) as episode:
- # Set agent info
- episode.set_agent_info(
- name=agent_name or func.__name__,
- version=agent_version,
  )
+ else:
+ episode_cm = _standalone_episode(operation, target_type, target_id)
+
+ with episode_cm as episode:
+ episode.set_agent_info(name=name, version=agent_version)
 
  # Make episode available in context
- LineageContext.set_episode(episode)
+ token = LineageContext.set_episode(episode)
 
  try:
  result = func(*args, **kwargs)
 
  # Extract context from result if function provided
  if extract_context and result is not None:
- context = extract_context(result)
- for pattern_id in context.get("pattern_ids", []):
- episode.add_context_pattern(pattern_id)
- for entity_id in context.get("entity_ids", []):
- episode.add_context_entity(entity_id)
- if "coherence_score" in context:
- episode.coherence_score = context["coherence_score"]
- if "detected_edges" in context:
- for edge in context["detected_edges"]:
- episode.add_detected_edge(**edge)
+ _apply_context(episode, extract_context(result))
 
  return result
  finally:
- LineageContext.set_episode(None)
- else:
- # Create standalone episode
+ # Restore the enclosing episode (if any) for nested calls
+ _episode_var.reset(token)
+
+ # Copy only the metadata tooling relies on (cheaper than functools.wraps)
+ wrapper.__module__ = func.__module__
+ wrapper.__name__ = func.__name__
+ wrapper.__qualname__ = func.__qualname__
+ wrapper.__doc__ = func.__doc__
+ wrapper.__wrapped__ = func
+ return wrapper # type: ignore
+
+ return decorator
+
+
+@contextmanager
+def _standalone_episode(
+ operation: OperationType,
+ target_type: TargetType | str,
+ target_id: str,
+) -> Generator[Episode, None, None]:
+ """Yield a run-less episode and queue it for a batched write on exit, recording any error."""
  episode = Episode(
  operation=operation,
  target_type=(
@@ -152,30 +178,12 @@ def emit_lineage(
  ),
  target_id=target_id,
  )
- episode.set_agent_info(
- name=agent_name or func.__name__,
- version=agent_version,
- )
-
- LineageContext.set_episode(episode)
-
  try:
- result = func(*args, **kwargs)
-
- # Extract context from result
- if extract_context and result is not None:
- context = extract_context(result)
- for pattern_id in context.get("pattern_ids", []):
- episode.add_context_pattern(pattern_id)
- for entity_id in context.get("entity_ids", []):
- episode.add_context_entity(entity_id)
- if "coherence_score" in context:
- episode.coherence_score = context["coherence_score"]
- if "detected_edges" in context:
- for edge in context["detected_edges"]:
- episode.add_detected_edge(**edge)
-
- # Persist standalone episode
+ yield episode
+ except Exception as e:
+ episode.error_message = str(e)
+ raise
+ finally:
  create_standalone_episode(
  operation=operation,
  target_type=target_type,
@@ -186,47 +194,34 @@ def emit_lineage(
  context_entity_ids=episode.context_entity_ids,
  coherence_score=episode.coherence_score,
  detected_edges=episode.detected_edges,
- )
-
- return result
- except Exception as e:
- episode.error_message = str(e)
- create_standalone_episode(
- operation=operation,
- target_type=target_type,
- target_id=target_id,
- agent_name=episode.agent_name,
  error_message=episode.error_message,
+ buffered=True,
  )
- raise
- finally:
- LineageContext.set_episode(None)
-
- return wrapper # type: ignore
-
- return decorator
-
 
-def _extract_param(
- func: Callable, param_name: str, args: tuple, kwargs: dict
-) -> Any | None:
- """Extract a parameter value from function arguments."""
- import inspect
 
- sig = inspect.signature(func)
- params = list(sig.parameters.keys)
+def _apply_context(episode: Episode, context: dict[str, Any]) -> None:
+ """Copy an extract_context result onto the episode."""
+ pattern_ids: list[str] | None = context.get("pattern_ids")
+ entity_ids: list[str] | None = context.get("entity_ids")
+ edges: list[dict[str, Any]] | None = context.get("detected_edges")
+ edge: dict[str, Any]
 
- # Check kwargs first
- if param_name in kwargs:
- return kwargs[param_name]
+ # Bulk set updates run in C instead of one method call per ID
+ if pattern_ids:
+ episode.context_pattern_ids.update(pattern_ids)
+ if entity_ids:
+ episode.context_entity_ids.update(entity_ids)
+ if "coherence_score" in context:
+ episode.coherence_score = context["coherence_score"]
+ if edges:
+ for edge in edges:
+ episode.add_detected_edge(**edge)
 
- # Check positional args
- if param_name in params:
- idx = params.index(param_name)
- if idx < len(args):
- return args[idx]
 
- return None
+def _param_index(func: Callable, param_name: str) -> int | None:
+ """Get the positional index of a parameter, or None if func has no such parameter."""
+ params = list(inspect.signature(func).parameters)
+ return params.index(param_name) if param_name in params else None
 
 
 def add_context_pattern(pattern_id: str) -> None:
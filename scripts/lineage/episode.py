@@ -5,11 +5,41 @@ An Episode represents one meaningful operation that modifies the DDD layer.
 """
 
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, UTC
+from functools import partial
 from enum import Enum
 from typing import Any
 import hashlib
-import ulid
+import operator
+import os
+import threading
+import time
+
+# ULID = 48-bit ms timestamp + 80 random bits, Crockford base32 (26 chars).
+# Randomness is drawn from the OS in batches, one urandom call per 256 IDs.
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ULID_BATCH = 256
+_ulid_local = threading.local
+
+
+def _reset_ulid_randomness -> None:
+ """Drop randomness inherited across fork, so parent and child never share ULIDs."""
+ global _ulid_local
+ _ulid_local = threading.local
+
+
+if hasattr(os, "register_at_fork"):
+ os.register_at_fork(after_in_child=_reset_ulid_randomness)
+
+
+def new_ulid -> str:
+ """Generate a ULID string (26-char Crockford base32, as ulid-py's str(ulid.new))."""
+ randomness = getattr(_ulid_local, "randomness", None)
+ if not randomness:
+ raw = os.urandom(10 * _ULID_BATCH)
+ randomness = _ulid_local.randomness = [raw[i:i + 10] for i in range(0, len(raw), 10)]
+ value = (time.time_ns // 1_000_000) << 80 | int.from_bytes(randomness.pop, "big")
+ return "".join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
 
 
 class OperationType(str, Enum):
@@ -33,7 +63,7 @@ class TargetType(str, Enum):
  DELIVERY = "delivery"
 
 
-@dataclass
+@dataclass(slots=True)
 class DetectedEdge:
  """A relationship detected/proposed by an agent."""
 
@@ -51,7 +81,16 @@ class DetectedEdge:
  }
 
 
-@dataclass
+# Episode fields that to_dict copies unchanged
+_PLAIN_FIELDS = (
+ "id", "run_id", "target_id", "coherence_score",
+ "agent_name", "agent_version", "model_name", "prompt_hash", "token_usage",
+ "input_hash", "error_message", "metadata", "created_at",
+)
+_get_plain_fields = operator.attrgetter(*_PLAIN_FIELDS)
+
+
+@dataclass(slots=True)
 class Episode:
  """
  An episode in the provenance chain.
@@ -66,15 +105,16 @@ class Episode:
  target_id: str
 
  # Auto-generated
- id: str = field(default_factory=lambda: str(ulid.new))
- created_at: datetime = field(default_factory=datetime.now)
+ id: str = field(default_factory=new_ulid)
+ created_at: datetime = field(default_factory=partial(datetime.now, UTC))
 
  # Run context (set by LineageTracker)
  run_id: str | None = None
 
- # Context used (for classification/declaration audits)
- context_pattern_ids: list[str] = field(default_factory=list)
- context_entity_ids: list[str] = field(default_factory=list)
+ # Context used (for classification/declaration audits); sets for O(1)
+ # dedup, serialized as sorted lists
+ context_pattern_ids: set[str] = field(default_factory=set)
+ context_entity_ids: set[str] = field(default_factory=set)
 
  # Quality signals
  coherence_score: float | None = None
@@ -86,28 +126,37 @@ class Episode:
  prompt_hash: str | None = None
  token_usage: dict[str, int] = field(default_factory=dict)
 
- # Detected edges
- detected_edges: list[DetectedEdge] = field(default_factory=list)
+ # Detected edges, held as DetectedEdge.to_dict-shaped dicts so persisting
+ # is one JSON dump with no per-edge conversion
+ detected_edges: list[dict[str, Any]] = field(default_factory=list)
 
  # Metadata
  input_hash: str | None = None
  error_message: str | None = None
  metadata: dict[str, Any] = field(default_factory=dict)
 
- def compute_input_hash(self, content: str) -> str:
- """Compute SHA256 hash of input for deduplication."""
- self.input_hash = f"sha256:{hashlib.sha256(content.encode).hexdigest[:16]}"
+ # Enum .value strings, cached once so serialization skips the enum property
+ operation_value: str = field(init=False, repr=False, compare=False)
+ target_type_value: str = field(init=False, repr=False, compare=False)
+
+ def __post_init__(self) -> None:
+ self.operation_value = self.operation.value
+ self.target_type_value = self.target_type.value
+
+ def compute_input_hash(self, content: str | bytes) -> str:
+ """Compute a 64-bit BLAKE2b hash of input for deduplication."""
+ if isinstance(content, str):
+ content = content.encode("utf-8", errors="surrogatepass")
+ self.input_hash = f"blake2b:{hashlib.blake2b(content, digest_size=8).hexdigest}"
  return self.input_hash
 
  def add_context_pattern(self, pattern_id: str) -> None:
  """Add a pattern to the context (retrieved/considered during operation)."""
- if pattern_id not in self.context_pattern_ids:
- self.context_pattern_ids.append(pattern_id)
+ self.context_pattern_ids.add(pattern_id)
 
  def add_context_entity(self, entity_id: str) -> None:
  """Add an entity to the context (used during operation)."""
- if entity_id not in self.context_entity_ids:
- self.context_entity_ids.append(entity_id)
+ self.context_entity_ids.add(entity_id)
 
  def add_detected_edge(
  self,
@@ -117,14 +166,12 @@ class Episode:
  rationale: str | None = None,
  ) -> None:
  """Add a model-detected relationship."""
- self.detected_edges.append(
- DetectedEdge(
- predicate=predicate,
- target_id=target_id,
- strength=strength,
- rationale=rationale,
- )
- )
+ self.detected_edges.append({
+ "predicate": predicate,
+ "target_id": target_id,
+ "strength": strength,
+ "rationale": rationale,
+ })
 
  def set_agent_info(
  self,
@@ -153,24 +200,18 @@ class Episode:
  }
 
  def to_dict(self) -> dict[str, Any]:
- """Convert to dictionary for database insertion."""
- return {
- "id": self.id,
- "run_id": self.run_id,
- "operation": self.operation.value,
- "target_type": self.target_type.value,
- "target_id": self.target_id,
- "context_pattern_ids": self.context_pattern_ids,
- "context_entity_ids": self.context_entity_ids,
- "coherence_score": self.coherence_score,
- "agent_name": self.agent_name,
- "agent_version": self.agent_version,
- "model_name": self.model_name,
- "prompt_hash": self.prompt_hash,
- "token_usage": self.token_usage,
- "detected_edges": [e.to_dict for e in self.detected_edges],
- "input_hash": self.input_hash,
- "error_message": self.error_message,
- "metadata": self.metadata,
- "created_at": self.created_at,
- }
+ """
+ Convert to dictionary for database insertion.
+
+ Pure: every container in the result is a fresh copy, so mutating it
+ never reaches the episode and repeated calls return equal dicts.
+ """
+ result = dict(zip(_PLAIN_FIELDS, _get_plain_fields(self)))
+ result["operation"] = self.operation_value
+ result["target_type"] = self.target_type_value
+ result["context_pattern_ids"] = sorted(self.context_pattern_ids)
+ result["context_entity_ids"] = sorted(self.context_entity_ids)
+ result["detected_edges"] = [dict(edge) for edge in self.detected_edges]
+ result["token_usage"] = dict(self.token_usage)
+ result["metadata"] = dict(self.metadata)
+ return result
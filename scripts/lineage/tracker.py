@@ -22,19 +22,33 @@ Usage:
 
 from __future__ import annotations
 
-import json
+import atexit
+import functools
+import operator
+import os
+import queue
+import threading
+import time
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Any, Callable, Generator
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterator
 
+import orjson
 import psycopg
-import ulid
-from pydantic_settings import BaseSettings
+from dotenv import load_dotenv
 
-from .episode import Episode, OperationType, TargetType
+from .episode import Episode, OperationType, TargetType, new_ulid
 
+if TYPE_CHECKING:
+ from psycopg_pool import ConnectionPool
 
-class TrackerSettings(BaseSettings):
+
+SYNC_COMMIT_MODES = ("off", "local", "on")
+
+
+@dataclass(frozen=True, slots=True)
+class TrackerSettings:
  """Configuration from environment variables (ADR-0010)."""
 
  semops_db_host: str = "localhost"
@@ -43,9 +57,245 @@ class TrackerSettings(BaseSettings):
  semops_db_user: str = "postgres"
  semops_db_password: str = "postgres"
 
- class Config:
- env_file = ".env"
- extra = "ignore"
+ # Lineage rows are an audit trail: losing the last few commits on a
+ # server crash is acceptable, waiting for a WAL flush per batch is not.
+ # Set SEMOPS_LINEAGE_SYNC_COMMIT=on to make every commit durable.
+ semops_lineage_sync_commit: str = "off"
+
+ def __post_init__(self) -> None:
+ if self.semops_lineage_sync_commit not in SYNC_COMMIT_MODES:
+ raise ValueError(
+ f"SEMOPS_LINEAGE_SYNC_COMMIT must be one of {SYNC_COMMIT_MODES}, "
+ f"got {self.semops_lineage_sync_commit!r}"
+ )
+
+ @classmethod
+ def from_env(cls) -> TrackerSettings:
+ """Read settings from the environment (.env fills in unset variables)."""
+ load_dotenv(".env")
+ return cls(**{
+ name: type(f.default)(os.environ[name.upper])
+ for name, f in cls.__dataclass_fields__.items
+ if name.upper in os.environ
+ })
+
+ @property
+ def connection_options(self) -> str:
+ """libpq options applied to every tracker connection at startup."""
+ return f"-c synchronous_commit={self.semops_lineage_sync_commit}"
+
+
+@functools.cache
+def get_settings -> TrackerSettings:
+ """Resolve TrackerSettings once per process."""
+ return TrackerSettings.from_env
+
+
+EPISODE_INSERT_SQL = """
+ INSERT INTO ingestion_episode (
+ id, run_id, operation, target_type, target_id,
+ context_pattern_ids, context_entity_ids, coherence_score,
+ agent_name, agent_version, model_name, prompt_hash, token_usage,
+ detected_edges, input_hash, error_message, metadata, created_at
+ ) VALUES (
+ %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+ )
+"""
+
+RUN_INSERT_SQL = """
+ INSERT INTO ingestion_run (
+ id, run_type, agent_name, source_name, started_at, status, source_config
+ ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+RUN_COMPLETE_SQL = """
+ UPDATE ingestion_run
+ SET completed_at = %s, status = %s, metrics = %s
+ WHERE id = %s
+"""
+
+# Same columns as EPISODE_INSERT_SQL, for batches large enough that COPY
+# beats per-row bind/execute
+EPISODE_COPY_SQL = """
+ COPY ingestion_episode (
+ id, run_id, operation, target_type, target_id,
+ context_pattern_ids, context_entity_ids, coherence_score,
+ agent_name, agent_version, model_name, prompt_hash, token_usage,
+ detected_edges, input_hash, error_message, metadata, created_at
+ ) FROM STDIN
+"""
+EPISODE_COPY_THRESHOLD = 500
+
+# Executions of the same statement text before psycopg prepares it
+# server-side; later episode INSERTs then skip parse and plan
+PREPARE_THRESHOLD = 5
+
+# Completed run episodes are written in batches of this size (and on run
+# exit) unless the tracker is given its own batch_size
+EPISODE_BATCH_SIZE = 100
+
+# Buffered standalone episodes (from @emit_lineage outside a run) are written
+# by a background thread in batches: when a batch fills, when the oldest
+# queued row is older than the interval, and at interpreter exit.
+STANDALONE_BATCH_SIZE = 100
+STANDALONE_FLUSH_INTERVAL = 0.25 # seconds
+
+# Pool shared by run trackers and standalone episode writes, opened on first use
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock
+
+
+def _dumps(value: Any) -> str:
+ """Serialize a JSONB column value (read-only mapping views become dicts)."""
+ return orjson.dumps(value, default=dict, option=orjson.OPT_NON_STR_KEYS).decode
+
+
+# Runs of EPISODE_INSERT_SQL columns that are bound as-is, fetched in one
+# C-level call each
+_get_row_head = operator.attrgetter(
+ "id", "run_id", "operation_value", "target_type_value", "target_id",
+)
+_get_row_agent = operator.attrgetter(
+ "coherence_score", "agent_name", "agent_version", "model_name", "prompt_hash",
+)
+
+
+def _episode_row(episode: Episode) -> tuple:
+ """Build the EPISODE_INSERT_SQL parameter tuple for an episode."""
+ return (
+ *_get_row_head(episode),
+ sorted(episode.context_pattern_ids),
+ sorted(episode.context_entity_ids),
+ *_get_row_agent(episode),
+ _dumps(episode.token_usage),
+ _dumps(episode.detected_edges),
+ episode.input_hash,
+ episode.error_message,
+ _dumps(episode.metadata),
+ episode.created_at,
+ )
+
+
+def _get_pool -> ConnectionPool:
+ """Get the module-level pool for lineage writes."""
+ global _pool
+ with _pool_lock:
+ if _pool is None:
+ # Imported here so `import lineage`, which runs in every worker
+ # that uses @emit_lineage, stays cheap until the first write
+ from psycopg.conninfo import make_conninfo
+ from psycopg_pool import ConnectionPool
+
+ settings = get_settings
+ _pool = ConnectionPool(
+ conninfo=make_conninfo(
+ host=settings.semops_db_host,
+ port=settings.semops_db_port,
+ dbname=settings.semops_db_name,
+ user=settings.semops_db_user,
+ password=settings.semops_db_password,
+ ),
+ min_size=2,
+ max_size=10,
+ kwargs={
+ "prepare_threshold": PREPARE_THRESHOLD,
+ "options": settings.connection_options,
+ },
+ open=True,
+ )
+ return _pool
+
+
+def _insert_episode_rows(cur: psycopg.Cursor, rows: list[tuple]) -> None:
+ """Insert episode rows with COPY above EPISODE_COPY_THRESHOLD, else executemany."""
+ if len(rows) > EPISODE_COPY_THRESHOLD:
+ with cur.copy(EPISODE_COPY_SQL) as copy:
+ for row in rows:
+ copy.write_row(row)
+ else:
+ cur.executemany(EPISODE_INSERT_SQL, rows)
+
+
+def _write_episode_rows(rows: list[tuple], conn: psycopg.Connection | None = None) -> None:
+ """Insert episode rows on conn, or on a pooled connection if none is given."""
+ if conn is None:
+ # The pool commits on clean exit from the block
+ with _get_pool.connection as pooled:
+ _insert_episode_rows(pooled.cursor, rows)
+ return
+
+ with conn.cursor as cur:
+ _insert_episode_rows(cur, rows)
+ conn.commit
+
+
+class _BackgroundEpisodeWriter:
+ """
+ Writes queued standalone episode rows from a daemon thread.
+
+ Callers only enqueue; the thread collects up to batch_size rows (or
+ whatever arrives within flush_interval of the first) and writes them
+ through the pool in one executemany.
+ """
+
+ def __init__(self, batch_size: int, flush_interval: float):
+ self.batch_size = batch_size
+ self.flush_interval = flush_interval
+ self._queue: queue.Queue[tuple] = queue.Queue
+ self._thread: threading.Thread | None = None
+ self._start_lock = threading.Lock
+
+ def submit(self, row: tuple) -> None:
+ """Queue a row for the writer thread, starting it on first use."""
+ if self._thread is None:
+ with self._start_lock:
+ if self._thread is None:
+ self._thread = threading.Thread(
+ target=self._run, name="lineage-episode-writer", daemon=True,
+ )
+ self._thread.start
+ self._queue.put(row)
+
+ def flush(self, conn: psycopg.Connection | None = None) -> int:
+ """Write everything still queued now and wait for any batch in flight."""
+ rows = []
+ while True:
+ try:
+ rows.append(self._queue.get_nowait)
+ except queue.Empty:
+ break
+ if rows:
+ self._write(rows, conn)
+ self._queue.join
+ return len(rows)
+
+ def _run(self) -> None:
+ while True:
+ rows = [self._queue.get]
+ deadline = time.monotonic + self.flush_interval
+ while len(rows) < self.batch_size:
+ timeout = deadline - time.monotonic
+ if timeout <= 0:
+ break
+ try:
+ rows.append(self._queue.get(timeout=timeout))
+ except queue.Empty:
+ break
+ try:
+ self._write(rows)
+ except Exception as e:
+ # Keep the writer alive; lineage must never take the caller down
+ print(f"Warning: Failed to write {len(rows)} lineage episode(s): {e}")
+
+ def _write(self, rows: list[tuple], conn: psycopg.Connection | None = None) -> None:
+ try:
+ _write_episode_rows(rows, conn)
+ finally:
+ for _ in rows:
+ self._queue.task_done
+
+
+_writer = _BackgroundEpisodeWriter(STANDALONE_BATCH_SIZE, STANDALONE_FLUSH_INTERVAL)
 
 
 class LineageTracker:
@@ -69,6 +319,7 @@ class LineageTracker:
  agent_name: str | None = None,
  source_config: dict[str, Any] | None = None,
  conn: psycopg.Connection | None = None,
+ batch_size: int = EPISODE_BATCH_SIZE,
  ):
  """
  Initialize a lineage tracker.
@@ -79,19 +330,23 @@ class LineageTracker:
  agent_name: Name of the agent/script running the ingestion
  source_config: Configuration snapshot for reproducibility
  conn: Optional existing database connection
+ batch_size: Completed episodes buffered per write; bulk runs can
+ raise this past EPISODE_COPY_THRESHOLD to persist via COPY
  """
  self.source_name = source_name
  self.run_type = run_type
  self.agent_name = agent_name
  self.source_config = source_config or {}
 
- self.settings = TrackerSettings
  self._conn = conn
  self._owns_conn = conn is None
 
  self.run_id: str | None = None
  self.started_at: datetime | None = None
  self._episodes: list[Episode] = []
+ self._pending: list[tuple] = [] # completed episode rows awaiting _flush
+ self._run_row: tuple | None = None # ingestion_run row awaiting _flush
+ self._batch_size = batch_size
  self._metrics: dict[str, int] = {
  "entities_created": 0,
  "entities_updated": 0,
@@ -102,40 +357,33 @@ class LineageTracker:
 
  @property
  def conn(self) -> psycopg.Connection:
- """Lazy database connection."""
+ """Lazy database connection, checked out of the shared pool for the run."""
  if self._conn is None or self._conn.closed:
- self._conn = psycopg.connect(
- host=self.settings.semops_db_host,
- port=self.settings.semops_db_port,
- dbname=self.settings.semops_db_name,
- user=self.settings.semops_db_user,
- password=self.settings.semops_db_password,
- )
+ if self._owns_conn and self._conn is not None:
+ # Hand the broken connection back so the pool can discard it
+ _get_pool.putconn(self._conn)
+ self._conn = _get_pool.getconn
+ # Pool-issued even if the caller's connection was replaced, so
+ # __exit__ must return it
+ self._owns_conn = True
  return self._conn
 
  def __enter__(self) -> LineageTracker:
- """Start a new ingestion run."""
- self.run_id = str(ulid.new)
- self.started_at = datetime.now
+ """Start a new ingestion run (the run row is written with the first flush)."""
+ self.run_id = new_ulid
+ self.started_at = datetime.now(UTC)
 
- with self.conn.cursor as cur:
- cur.execute(
- """
- INSERT INTO ingestion_run (
- id, run_type, agent_name, source_name, started_at, status, source_config
- ) VALUES (%s, %s, %s, %s, %s, %s, %s)
- """,
- (
+ # Queued rather than committed here, so it shares a round trip with
+ # the first batch of episodes that reference it
+ self._run_row = (
  self.run_id,
  self.run_type,
  self.agent_name,
  self.source_name,
  self.started_at,
  "running",
- json.dumps(self.source_config),
- ),
+ _dumps(self.source_config),
  )
- self.conn.commit
 
  return self
 
@@ -146,24 +394,24 @@ class LineageTracker:
  if exc_type:
  self._metrics["errors"] += 1
 
- with self.conn.cursor as cur:
- cur.execute(
- """
- UPDATE ingestion_run
- SET completed_at = %s, status = %s, metrics = %s
- WHERE id = %s
- """,
- (
- datetime.now,
+ try:
+ self._flush(
+ run_update=(
+ datetime.now(UTC),
  status,
- json.dumps(self._metrics),
+ _dumps(self._metrics),
  self.run_id,
  ),
  )
- self.conn.commit
-
- if self._owns_conn and self._conn:
- self._conn.close
+ except psycopg.Error as e:
+ # Don't mask the with-body's own exception with a lineage write failure
+ if exc_type is None:
+ raise
+ print(f"Warning: Failed to complete lineage run {self.run_id}: {e}")
+ finally:
+ if self._owns_conn and self._conn is not None:
+ _get_pool.putconn(self._conn)
+ self._conn = None
 
  def start_episode(
  self,
@@ -200,7 +448,9 @@ class LineageTracker:
 
  def complete_episode(self, episode: Episode) -> str:
  """
- Complete and persist an episode.
+ Complete an episode and queue it for persistence.
+
+ Rows are written batch_size at a time, and on run exit.
 
  Args:
  episode: The episode to complete
@@ -208,46 +458,45 @@ class LineageTracker:
  Returns:
  The episode ID
  """
- with self.conn.cursor as cur:
- cur.execute(
- """
- INSERT INTO ingestion_episode (
- id, run_id, operation, target_type, target_id,
- context_pattern_ids, context_entity_ids, coherence_score,
- agent_name, agent_version, model_name, prompt_hash, token_usage,
- detected_edges, input_hash, error_message, metadata, created_at
- ) VALUES (
- %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
- )
- """,
- (
- episode.id,
- episode.run_id,
- episode.operation.value,
- episode.target_type.value,
- episode.target_id,
- episode.context_pattern_ids,
- episode.context_entity_ids,
- episode.coherence_score,
- episode.agent_name,
- episode.agent_version,
- episode.model_name,
- episode.prompt_hash,
- json.dumps(episode.token_usage),
- json.dumps([e.to_dict for e in episode.detected_edges]),
- episode.input_hash,
- episode.error_message,
- json.dumps(episode.metadata),
- episode.created_at,
- ),
- )
- self.conn.commit
+ self._pending.append(_episode_row(episode))
+ if len(self._pending) >= self._batch_size:
+ self._flush
 
  # Update metrics
  self._update_metrics(episode)
 
  return episode.id
 
+ def _flush(self, run_update: tuple | None = None) -> None:
+ """
+ Write pending rows in one batch and commit once.
+
+ Sends, in order: the queued ingestion_run INSERT, pending episode
+ rows, and run_update (RUN_COMPLETE_SQL parameters) if given.
+ """
+ if self._run_row is None and not self._pending and run_update is None:
+ return
+
+ with self.conn.cursor as cur:
+ if len(self._pending) > EPISODE_COPY_THRESHOLD:
+ # COPY is not allowed in pipeline mode
+ self._write_pending(cur, run_update)
+ else:
+ with self.conn.pipeline:
+ self._write_pending(cur, run_update)
+ self.conn.commit
+ self._run_row = None
+ self._pending.clear
+
+ def _write_pending(self, cur: psycopg.Cursor, run_update: tuple | None) -> None:
+ """Send the statements for _flush on cur (without committing)."""
+ if self._run_row is not None:
+ cur.execute(RUN_INSERT_SQL, self._run_row)
+ if self._pending:
+ _insert_episode_rows(cur, self._pending)
+ if run_update is not None:
+ cur.execute(RUN_COMPLETE_SQL, run_update)
+
  def fail_episode(self, episode: Episode, error: str) -> str:
  """
  Mark an episode as failed and persist it.
@@ -261,7 +510,11 @@ class LineageTracker:
  """
  episode.error_message = error
  self._metrics["errors"] += 1
- return self.complete_episode(episode)
+ self.complete_episode(episode)
+
+ # Make the error durable now rather than at the next batch boundary
+ self._flush
+ return episode.id
 
  def _update_metrics(self, episode: Episode) -> None:
  """Update run-level metrics based on episode."""
@@ -323,6 +576,7 @@ def create_standalone_episode(
  target_type: TargetType | str,
  target_id: str,
  conn: psycopg.Connection | None = None,
+ buffered: bool = False,
  **kwargs: Any,
 ) -> Episode:
  """
@@ -334,26 +588,13 @@ def create_standalone_episode(
  operation: Type of operation
  target_type: Type of target
  target_id: ID of target
- conn: Optional database connection
+ conn: Optional database connection (unbuffered writes only)
+ buffered: Hand the write to the background writer and return at once
  **kwargs: Additional Episode fields
 
  Returns:
  The created Episode
  """
- settings = TrackerSettings
-
- if conn is None:
- conn = psycopg.connect(
- host=settings.semops_db_host,
- port=settings.semops_db_port,
- dbname=settings.semops_db_name,
- user=settings.semops_db_user,
- password=settings.semops_db_password,
- )
- owns_conn = True
- else:
- owns_conn = False
-
  if isinstance(target_type, str):
  target_type = TargetType(target_type)
 
@@ -364,43 +605,76 @@ def create_standalone_episode(
  **kwargs,
  )
 
- try:
- with conn.cursor as cur:
+ if buffered:
+ _writer.submit(_episode_row(episode))
+ return episode
+
+ _write_episode_rows([_episode_row(episode)], conn)
+ return episode
+
+
+def flush_standalone_episodes(conn: psycopg.Connection | None = None) -> int:
+ """
+ Write all buffered standalone episodes now, in one executemany.
+
+ Returns once the background writer has no batch in flight either, so
+ every episode queued before the call is in the database.
+
+ Args:
+ conn: Optional database connection
+
+ Returns:
+ Number of still-queued episodes written by this call
+ """
+ return _writer.flush(conn)
+
+
+def stream_episodes(
+ run_id: str,
+ conn: psycopg.Connection | None = None,
+ itersize: int = 1000,
+) -> Iterator[tuple]:
+ """
+ Yield every episode of a run, oldest first.
+
+ Runs can hold an unbounded number of episodes, so this reads through a
+ server-side (named) cursor in itersize batches instead of fetchall.
+ Bounded reads (LIMIT N) should keep using a plain client-side cursor.
+
+ Args:
+ run_id: Ingestion run ID
+ conn: Optional database connection (must not be in autocommit mode)
+ itersize: Rows fetched per server round trip
+
+ Yields:
+ (id, operation, target_type, target_id, coherence_score,
+ agent_name, error_message, created_at) rows
+ """
+ if conn is None:
+ with _get_pool.connection as pooled:
+ yield from stream_episodes(run_id, pooled, itersize)
+ return
+
+ with conn.cursor(name="lineage_scan") as cur:
+ cur.itersize = itersize
  cur.execute(
  """
- INSERT INTO ingestion_episode (
- id, run_id, operation, target_type, target_id,
- context_pattern_ids, context_entity_ids, coherence_score,
- agent_name, agent_version, model_name, prompt_hash, token_usage,
- detected_edges, input_hash, error_message, metadata, created_at
- ) VALUES (
- %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
- )
+ SELECT id, operation, target_type, target_id, coherence_score,
+ agent_name, error_message, created_at
+ FROM ingestion_episode
+ WHERE run_id = %s
+ ORDER BY created_at
  """,
- (
- episode.id,
- episode.run_id,
- episode.operation.value,
- episode.target_type.value,
- episode.target_id,
- episode.context_pattern_ids,
- episode.context_entity_ids,
- episode.coherence_score,
- episode.agent_name,
- episode.agent_version,
- episode.model_name,
- episode.prompt_hash,
- json.dumps(episode.token_usage),
- json.dumps([e.to_dict for e in episode.detected_edges]),
- episode.input_hash,
- episode.error_message,
- json.dumps(episode.metadata),
- episode.created_at,
- ),
+ (run_id,),
  )
- conn.commit
- finally:
- if owns_conn:
- conn.close
+ yield from cur
 
- return episode
+
+@atexit.register
+def _shutdown -> None:
+ """Flush buffered episodes, then close the pool (atexit runs this once)."""
+ try:
+ flush_standalone_episodes
+ finally:
+ if _pool is not None:
+ _pool.close
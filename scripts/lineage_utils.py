@@ -6,11 +6,13 @@ Provides functions for logging lineage events to /lineage/events.ndjson
 with configuration-based enable/disable support.
 """
 
+import atexit
 import os
-import json
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any, Literal
+from typing import Optional, Dict, Any, Literal, BinaryIO
+
+import orjson
 
 # Event types
 EventType = Literal[
@@ -33,22 +35,49 @@ EventType = Literal[
 # Lineage tracking modes
 TrackingMode = Literal["full", "minimal", "off"]
 
+# Events logged in 'minimal' mode:
+# - Publishing/ingestion operations
+# - Delivery status changes
+# - GitHub merges/releases
+# - Entity creation (but not updates)
+MAJOR_EVENTS = frozenset({
+ "entity_created",
+ "delivery_published",
+ "delivery_failed",
+ "ingestion_completed",
+ "github_pr_merged",
+ "github_release_published",
+})
+
+# Write buffer for the events file; the OS page cache does the rest
+LINEAGE_FILE_BUFFER_SIZE = 1 << 16
+
+# Events queued in memory before they go out in a single write
+LINEAGE_BATCH_SIZE = 64
+
 
 class LineageTracker:
  """
  Centralized lineage event tracker with configurable enable/disable.
  """
 
- def __init__(self, lineage_file: Optional[str] = None):
+ def __init__(self, lineage_file: Optional[str] = None, batch_size: int = LINEAGE_BATCH_SIZE):
  """
  Initialize lineage tracker.
 
  Args:
  lineage_file: Path to lineage events file (defaults to /lineage/events.ndjson)
+ batch_size: Events queued before a write; major events always write at once
  """
  self.lineage_file = lineage_file or self._get_default_lineage_file
+ # Environment is read once here, not per event
  self.enabled = self._is_enabled
  self.mode = self._get_tracking_mode
+ self._should_log_all = self.enabled and self.mode == "full"
+ self._should_log_major = self.enabled and self.mode == "minimal"
+ self.batch_size = batch_size
+ self._fh: Optional[BinaryIO] = None # opened on first logged event
+ self._queue: list[bytes] = []
 
  def _get_default_lineage_file(self) -> str:
  """Get default lineage file path."""
@@ -69,24 +98,32 @@ class LineageTracker:
  return "minimal" # Default to minimal if invalid value
 
  def _is_major_event(self, event_type: EventType) -> bool:
- """
- Determine if an event is considered 'major' for minimal tracking.
-
- Major events:
- - Publishing/ingestion operations
- - Delivery status changes
- - GitHub merges/releases
- - Entity creation (but not updates)
- """
- major_events = {
- "entity_created",
- "delivery_published",
- "delivery_failed",
- "ingestion_completed",
- "github_pr_merged",
- "github_release_published",
- }
- return event_type in major_events
+ """Determine if an event is considered 'major' (see MAJOR_EVENTS) for minimal tracking."""
+ return event_type in MAJOR_EVENTS
+
+ def _get_file(self) -> BinaryIO:
+ """Get the append-mode events file, opening it on first use."""
+ if self._fh is None:
+ self._fh = open(self.lineage_file, "ab", buffering=LINEAGE_FILE_BUFFER_SIZE)
+ atexit.register(self.close)
+ return self._fh
+
+ def flush(self) -> None:
+ """Write all queued events in one write and flush them to the OS."""
+ if not self._queue:
+ return
+ fh = self._get_file
+ fh.write(b"".join(self._queue))
+ fh.flush
+ self._queue.clear
+
+ def close(self) -> None:
+ """Flush and close the events file (reopened by the next log_event)."""
+ self.flush
+ if self._fh is not None:
+ self._fh.close
+ self._fh = None
+ atexit.unregister(self.close)
 
  def should_log(self, event_type: EventType) -> bool:
  """
@@ -98,19 +135,12 @@ class LineageTracker:
  Returns:
  True if event should be logged, False otherwise
  """
- # If tracking disabled or mode is 'off', don't log
- if not self.enabled or self.mode == "off":
- return False
-
  # If mode is 'full', log everything
- if self.mode == "full":
+ if self._should_log_all:
  return True
 
- # If mode is 'minimal', only log major events
- if self.mode == "minimal":
- return self._is_major_event(event_type)
-
- return False
+ # If mode is 'minimal', only log major events; disabled or 'off' logs nothing
+ return self._should_log_major and event_type in MAJOR_EVENTS
 
  def log_event(
  self,
@@ -154,8 +184,12 @@ class LineageTracker:
 
  # Append to NDJSON file
  try:
- with open(self.lineage_file, "a") as f:
- f.write(json.dumps(event) + "\n")
+ if self._fh is None:
+ self._get_file # registers the atexit flush before anything is queued
+ self._queue.append(orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
+ # Major events are written straight away so they survive a crash
+ if len(self._queue) >= self.batch_size or event_type in MAJOR_EVENTS:
+ self.flush
  return True
  except Exception as e:
  print(f"Warning: Failed to log lineage event: {e}")
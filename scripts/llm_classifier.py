@@ -18,10 +18,14 @@ Usage:
 
 from __future__ import annotations
 
-import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+import orjson
+
 from entity_builder import LLMClassification
 
 
@@ -47,6 +51,14 @@ Classify the given markdown document and return a JSON object with these fields:
 
 IMPORTANT: Return ONLY valid JSON, no explanation or markdown code blocks."""
 
+# Below this many documents classify_batch uses live calls; the Message
+# Batches API trades latency (minutes to hours) for ~50% lower cost
+BATCH_MIN_SIZE = 20
+BATCH_POLL_INTERVAL = 30 # seconds
+
+# A classification reply must open with a JSON object or a ``` fence
+JSON_RESPONSE_STARTS = "{`"
+
 
 class LLMClassifier:
  """
@@ -55,6 +67,9 @@ class LLMClassifier:
  Attributes:
  model: Claude model to use (default: claude-sonnet-4-20250514)
  max_content_length: Max content length to send (truncated if longer)
+ max_retries: Retries on 429/5xx (the SDK honours Retry-After)
+
+ Safe to share across threads; ingestion classifies files concurrently.
  """
 
  def __init__(
@@ -62,6 +77,7 @@ class LLMClassifier:
  api_key: Optional[str] = None,
  model: str = "claude-sonnet-4-20250514",
  max_content_length: int = 8000,
+ max_retries: int = 5,
  ):
  """
  Initialize classifier.
@@ -70,6 +86,7 @@ class LLMClassifier:
  api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY env var)
  model: Model to use for classification
  max_content_length: Max content length to send
+ max_retries: Retries on rate limit / overload responses
  """
  self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
  if not self.api_key:
@@ -77,15 +94,22 @@ class LLMClassifier:
 
  self.model = model
  self.max_content_length = max_content_length
+ self.max_retries = max_retries
  self._client = None
+ self._client_lock = threading.Lock
 
  @property
  def client(self):
  """Lazy-load Anthropic client."""
  if self._client is None:
+ with self._client_lock:
+ if self._client is None:
  import anthropic
 
- self._client = anthropic.Anthropic(api_key=self.api_key)
+ self._client = anthropic.Anthropic(
+ api_key=self.api_key,
+ max_retries=self.max_retries,
+ )
  return self._client
 
  def classify(self, content: str) -> LLMClassification:
@@ -101,25 +125,50 @@ class LLMClassifier:
  Raises:
  RuntimeError: If API call fails or response is invalid
  """
- # Truncate if needed
- truncated = content[: self.max_content_length]
-
  try:
- response = self.client.messages.create(
- model=self.model,
- max_tokens=1024,
- system=CLASSIFICATION_SYSTEM_PROMPT,
- messages=[{"role": "user", "content": f"Classify this document:\n\n{truncated}"}],
- )
+ # Streamed so an off-format reply is dropped at its first token
+ # instead of after the whole completion has been generated
+ chunks: list[str] = []
+ prefix_checked = False
+ with self.client.messages.stream(**self._request_params(content)) as stream:
+ for text in stream.text_stream:
+ chunks.append(text)
+ if not prefix_checked:
+ head = "".join(chunks).lstrip
+ if head:
+ if head[0] not in JSON_RESPONSE_STARTS:
+ raise RuntimeError(f"response is not JSON: {head[:80]!r}")
+ prefix_checked = True
+
+ return self._parse_response("".join(chunks))
+
+ except orjson.JSONDecodeError as e:
+ raise RuntimeError(f"Failed to parse LLM response as JSON: {e}")
+ except Exception as e:
+ raise RuntimeError(f"LLM classification failed: {e}")
 
- response_text = response.content[0].text.strip
+ def _request_params(self, content: str) -> dict:
+ """Build the Messages API parameters for one document."""
+ # Truncate if needed
+ truncated = content[: self.max_content_length]
+ return {
+ "model": self.model,
+ "max_tokens": 1024,
+ "system": CLASSIFICATION_SYSTEM_PROMPT,
+ "messages": [{"role": "user", "content": f"Classify this document:\n\n{truncated}"}],
+ }
+
+ @staticmethod
+ def _parse_response(response_text: str) -> LLMClassification:
+ """Parse a model response into an LLMClassification (raises JSONDecodeError)."""
+ response_text = response_text.strip
 
  # Handle potential markdown code blocks
  if response_text.startswith("```"):
  lines = response_text.split("\n")
  response_text = "\n".join(lines[1:-1])
 
- data = json.loads(response_text)
+ data = orjson.loads(response_text)
 
  return LLMClassification(
  content_type=data.get("content_type", ""),
@@ -132,10 +181,78 @@ class LLMClassifier:
  detected_edges=data.get("detected_edges"),
  )
 
- except json.JSONDecodeError as e:
+ def classify_many(self, contents: list[str], concurrency: int = 8) -> list[LLMClassification]:
+ """
+ Classify many documents with up to `concurrency` API calls in flight.
+
+ Wall time is roughly the slowest call per wave rather than the sum of
+ all calls; the SDK's retries absorb rate limiting.
+
+ Args:
+ contents: Markdown document contents
+ concurrency: Maximum concurrent API calls
+
+ Returns:
+ One LLMClassification per document, in input order
+
+ Raises:
+ RuntimeError: If any classification fails
+ """
+ with ThreadPoolExecutor(max_workers=concurrency) as executor:
+ return list(executor.map(self.classify, contents))
+
+ def classify_batch(
+ self,
+ contents: list[str],
+ poll_interval: float = BATCH_POLL_INTERVAL,
+ ) -> list[LLMClassification]:
+ """
+ Classify many documents through the Message Batches API.
+
+ For non-interactive bulk runs: one submission, processed server-side
+ at reduced cost, polled until it ends. Fewer than BATCH_MIN_SIZE
+ documents go through classify_many instead.
+
+ Args:
+ contents: Markdown document contents
+ poll_interval: Seconds between batch status checks
+
+ Returns:
+ One LLMClassification per document, in input order
+
+ Raises:
+ RuntimeError: If the batch fails or any request in it errors
+ """
+ if len(contents) < BATCH_MIN_SIZE:
+ return self.classify_many(contents)
+
+ try:
+ batch = self.client.messages.batches.create(
+ requests=[
+ {"custom_id": str(i), "params": self._request_params(content)}
+ for i, content in enumerate(contents)
+ ],
+ )
+ while batch.processing_status != "ended":
+ time.sleep(poll_interval)
+ batch = self.client.messages.batches.retrieve(batch.id)
+
+ results: list[LLMClassification | None] = [None] * len(contents)
+ for entry in self.client.messages.batches.results(batch.id):
+ if entry.result.type != "succeeded":
+ raise RuntimeError(f"request {entry.custom_id} {entry.result.type}")
+ results[int(entry.custom_id)] = self._parse_response(
+ entry.result.message.content[0].text
+ )
+
+ except orjson.JSONDecodeError as e:
  raise RuntimeError(f"Failed to parse LLM response as JSON: {e}")
  except Exception as e:
- raise RuntimeError(f"LLM classification failed: {e}")
+ raise RuntimeError(f"LLM batch classification failed: {e}")
+
+ if None in results:
+ raise RuntimeError("LLM batch classification failed: batch returned incomplete results")
+ return results
 
 
 if __name__ == "__main__":
@@ -10,83 +10,110 @@ Usage:
 """
 
 import argparse
-import json
 import os
-import subprocess
 import sys
 
+import httpx
+import orjson
+import psycopg
+
+from db_utils import get_db_connection
+
 OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 EMBEDDING_MODEL = "nomic-embed-text"
 
+# Keep-alive client for Ollama, created on first use
+_ollama_client: httpx.Client | None = None
+
+# Result sets from search_query, keyed by (query, limit); oldest evicted first
+SEARCH_CACHE_SIZE = 1024
+_search_cache: dict[tuple[str, int], list[dict]] = {}
+
+
+def _get_ollama_client -> httpx.Client:
+ """Get the shared Ollama client."""
+ global _ollama_client
+ if _ollama_client is None:
+ _ollama_client = httpx.Client(base_url=OLLAMA_HOST, timeout=30)
+ return _ollama_client
+
 
 def generate_embedding(text: str) -> list[float] | None:
  """Generate embedding using Ollama."""
  try:
- result = subprocess.run(
- [
- "curl", "-s", f"{OLLAMA_HOST}/api/embeddings",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"model": EMBEDDING_MODEL, "prompt": text})
- ],
- capture_output=True,
- text=True,
- timeout=30
+ response = _get_ollama_client.post(
+ "/api/embeddings",
+ json={"model": EMBEDDING_MODEL, "prompt": text},
  )
-
- if result.returncode != 0:
+ response.raise_for_status
+ return orjson.loads(response.content).get("embedding")
+ except (httpx.HTTPError, ValueError):
  return None
 
- response = json.loads(result.stdout)
- return response.get("embedding")
 
- except (subprocess.TimeoutExpired, json.JSONDecodeError):
- return None
-
-
-def search_concepts(embedding: list[float], limit: int = 5) -> list[dict]:
+def search_concepts(
+ conn: psycopg.Connection,
+ embedding: list[float],
+ limit: int = 5,
+) -> list[dict]:
  """Search concepts by embedding similarity."""
- embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-
- sql = f"""
+ with conn.cursor as cursor:
+ try:
+ cursor.execute(
+ """
  SELECT
  id,
  preferred_label,
  definition,
  provenance,
- 1 - (embedding_local <=> '{embedding_str}'::vector) as similarity
+ 1 - (embedding_local <=> %(embedding)s::vector) as similarity
  FROM concept
  WHERE embedding_local IS NOT NULL
- ORDER BY embedding_local <=> '{embedding_str}'::vector
- LIMIT {limit};
- """
-
- result = subprocess.run(
- ["docker", "exec", "supabase-db", "psql", "-U", "postgres", "-d", "postgres",
- "-t", "-A", "-F", "|", "-c", sql],
- capture_output=True,
- text=True
+ ORDER BY embedding_local <=> %(embedding)s::vector
+ LIMIT %(limit)s
+ """,
+ {"embedding": embedding, "limit": limit},
  )
-
- if result.returncode != 0:
- print(f"Search error: {result.stderr}", file=sys.stderr)
+ except psycopg.Error as e:
+ print(f"Search error: {e}", file=sys.stderr)
  return []
 
  results = []
- for line in result.stdout.strip.split("\n"):
- if line:
- parts = line.split("|")
- if len(parts) >= 5:
+ for concept_id, label, definition, provenance, similarity in cursor.fetchall:
+ definition = definition or ""
  results.append({
- "id": parts[0],
- "label": parts[1],
- "definition": parts[2][:100] + "..." if len(parts[2]) > 100 else parts[2],
- "provenance": parts[3],
- "similarity": float(parts[4])
+ "id": concept_id,
+ "label": label,
+ "definition": definition[:100] + "..." if len(definition) > 100 else definition,
+ "provenance": provenance,
+ "similarity": similarity,
  })
 
  return results
 
 
+def search_query(conn: psycopg.Connection, query: str, limit: int = 5) -> list[dict] | None:
+ """
+ Embed a query and search concepts, reusing results for repeated queries.
+
+ Returns None if the query could not be embedded.
+ """
+ key = (query, limit)
+ if key in _search_cache:
+ return _search_cache[key]
+
+ embedding = generate_embedding(query)
+ if embedding is None:
+ return None
+
+ results = search_concepts(conn, embedding, limit)
+ if results: # search errors also come back empty; don't pin them
+ if len(_search_cache) >= SEARCH_CACHE_SIZE:
+ del _search_cache[next(iter(_search_cache))]
+ _search_cache[key] = results
+ return results
+
+
 def main:
  parser = argparse.ArgumentParser(description="Semantic search over concepts")
  parser.add_argument("query", type=str, help="Search query")
@@ -96,15 +123,17 @@ def main:
  print(f"Query: {args.query}")
  print("=" * 60)
 
- # Generate query embedding
- embedding = generate_embedding(args.query)
- if embedding is None:
+ # Embed and search
+ conn = get_db_connection(autocommit=True)
+ try:
+ results = search_query(conn, args.query, args.limit)
+ finally:
+ conn.close
+
+ if results is None:
  print("Error: Could not generate embedding", file=sys.stderr)
  sys.exit(1)
 
- # Search
- results = search_concepts(embedding, args.limit)
-
  if not results:
  print("No results found")
  return
@@ -5,68 +5,66 @@ Lineage Tracking Management Script
 Manage lineage tracking settings - enable/disable, change modes, check status.
 """
 
+import mmap
+import re
 import sys
 import os
 from pathlib import Path
 
+ENV_FILE = Path(__file__).parent.parent / ".env"
 
-def load_env_file -> dict:
- """Load .env file and return as dictionary."""
- env_file = Path(__file__).parent.parent / ".env"
- if not env_file.exists:
- print("Error: .env file not found")
- sys.exit(1)
+# Matches the key of an assignment line, ignoring surrounding whitespace
+ENV_KEY_PATTERN = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=")
 
- env_vars = {}
- with open(env_file, "r") as f:
- for line in f:
- line = line.strip
- # Skip comments and empty lines
- if not line or line.startswith("#"):
- continue
- # Parse key=value
- if "=" in line:
- key, value = line.split("=", 1)
- env_vars[key.strip] = value.strip
+# KEY=value lines over the raw file bytes; comments and blank lines never match
+ENV_LINE_PATTERN = re.compile(rb"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$", re.MULTILINE)
 
- return env_vars
 
+def load_env -> tuple[dict, list[str]]:
+ """
+ Load .env file in a single read, mapping it rather than buffering it.
 
-def save_env_file(env_vars: dict):
- """Save environment variables back to .env file."""
- env_file = Path(__file__).parent.parent / ".env"
+ Returns the parsed variables together with the raw lines, so a caller
+ that updates settings can hand both to save_env without re-reading.
+ """
+ env_vars = {}
+ lines = []
+ try:
+ with open(ENV_FILE, "rb") as f:
+ # mmap rejects empty files, so only map when there is something to read
+ if os.fstat(f.fileno).st_size:
+ with mmap.mmap(f.fileno, 0, access=mmap.ACCESS_READ) as mm:
+ # One regex sweep over the mapped bytes for the values...
+ for key, value in ENV_LINE_PATTERN.findall(mm):
+ env_vars[key.decode("utf-8")] = value.decode("utf-8")
+ # ...and the raw lines, kept for save_env
+ lines = [line.decode("utf-8") for line in iter(mm.readline, b"")]
+ except FileNotFoundError:
+ print("Error: .env file not found")
+ sys.exit(1)
 
- # Read original file to preserve comments and structure
- with open(env_file, "r") as f:
- lines = f.readlines
+ return env_vars, lines
 
- # Update values
+
+def save_env(env_vars: dict, lines: list[str]):
+ """Rewrite .env from the lines returned by load_env, preserving comments and structure."""
  updated_lines = []
  for line in lines:
- stripped = line.strip
- # Keep comments and empty lines as-is
- if not stripped or stripped.startswith("#"):
- updated_lines.append(line)
- continue
-
- # Update variable values
- if "=" in stripped:
- key = stripped.split("=", 1)[0].strip
+ # Comments, blank lines and unknown keys are kept as-is
+ match = ENV_KEY_PATTERN.match(line)
+ key = match.group(1) if match else None
  if key in env_vars:
  updated_lines.append(f"{key}={env_vars[key]}\n")
  else:
  updated_lines.append(line)
- else:
- updated_lines.append(line)
 
- # Write back
- with open(env_file, "w") as f:
+ with open(ENV_FILE, "w") as f:
  f.writelines(updated_lines)
 
 
 def get_status:
  """Get current lineage tracking status."""
- env_vars = load_env_file
+ env_vars, _ = load_env
 
  enabled = env_vars.get("ENABLE_LINEAGE_TRACKING", "false")
  mode = env_vars.get("LINEAGE_TRACKING_MODE", "minimal")
@@ -100,18 +98,18 @@ def get_status:
 
 def enable_tracking:
  """Enable lineage tracking."""
- env_vars = load_env_file
+ env_vars, lines = load_env
  env_vars["ENABLE_LINEAGE_TRACKING"] = "true"
- save_env_file(env_vars)
+ save_env(env_vars, lines)
  print("✅ Lineage tracking ENABLED")
  print(f" Mode: {env_vars.get('LINEAGE_TRACKING_MODE', 'minimal')}")
 
 
 def disable_tracking:
  """Disable lineage tracking."""
- env_vars = load_env_file
+ env_vars, lines = load_env
  env_vars["ENABLE_LINEAGE_TRACKING"] = "false"
- save_env_file(env_vars)
+ save_env(env_vars, lines)
  print("❌ Lineage tracking DISABLED")
 
 
@@ -123,9 +121,9 @@ def set_mode(mode: str):
  print(f"Valid modes: {', '.join(valid_modes)}")
  sys.exit(1)
 
- env_vars = load_env_file
+ env_vars, lines = load_env
  env_vars["LINEAGE_TRACKING_MODE"] = mode
- save_env_file(env_vars)
+ save_env(env_vars, lines)
 
  print(f"✅ Lineage tracking mode set to: {mode}")
  if mode == "full":
@@ -3,24 +3,29 @@
 Materialize entity edges into Neo4j graph.
 
 Reads detected_edges from entity metadata in Supabase and creates
-nodes + relationships in Neo4j. Safe to re-run (uses MERGE).
+nodes + relationships in Neo4j. Safe to re-run (uses MERGE); entities
+whose content hash is unchanged since the last run are skipped.
 
 Usage:
  python scripts/materialize_graph.py
  python scripts/materialize_graph.py --dry-run
  python scripts/materialize_graph.py --clear
+ python scripts/materialize_graph.py --force
 """
 
 from __future__ import annotations
 
 import argparse
-import json
+import hashlib
 import os
-import subprocess
+import re
 import sys
 from pathlib import Path
 
+import orjson
 import psycopg
+from neo4j import GraphDatabase
+from neo4j.exceptions import DriverError, Neo4jError
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
@@ -29,31 +34,168 @@ from db_utils import get_db_connection
 
 console = Console
 
-NEO4J_URL = os.environ.get("NEO4J_URL", "http://localhost:7474")
-
-
-def neo4j_escape(s: str) -> str:
- """Escape for Cypher."""
- return s.replace("\\", "\\\\").replace("'", "\\'")
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "") # Empty for no auth
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "")
+
+# Node and edge rows sent per write transaction
+NEO4J_BATCH_SIZE = 500
+
+# Entity rows fetched per round trip from the server-side cursor
+ENTITY_FETCH_SIZE = 500
+
+ENTITY_EDGES_FILTER = (
+ "metadata->'detected_edges' IS NOT NULL "
+ "AND jsonb_array_length(metadata->'detected_edges') > 0"
+)
+
+# Relationship types can't be parameters; anything outside this set becomes "_".
+# The type is also backtick-quoted in EDGE_CYPHER, so a leading digit is valid;
+# the sanitized name can never contain a backtick itself.
+REL_TYPE_INVALID_CHARS = re.compile(r"[^A-Z0-9_]")
+
+ENTITY_NODE_CYPHER = (
+ "UNWIND $rows AS r "
+ "MERGE (n:Entity {id: r.id}) "
+ "SET n.title = r.title, n.corpus = r.corpus, n.content_type = r.content_type, "
+ "n.content_hash = r.content_hash"
+)
+STORED_HASHES_CYPHER = (
+ "MATCH (n:Entity) WHERE n.id IN $ids "
+ "RETURN n.id AS id, n.content_hash AS content_hash"
+)
+# One statement per predicate, since the relationship type is part of the query
+EDGE_CYPHER = (
+ "UNWIND $rows AS r "
+ "MERGE (s:Entity {{id: r.sid}}) "
+ "MERGE (t:Concept {{id: r.tid}}) "
+ "MERGE (s)-[e:`{predicate}`]->(t) "
+ "SET e.strength = r.strength, e.rationale = r.rationale"
+)
+
+_neo4j_driver = None
+
+
+def _get_neo4j_driver:
+ """Get the module-level Bolt driver (created on first use; it pools connections)."""
+ global _neo4j_driver
+ if _neo4j_driver is None:
+ auth = None
+ if NEO4J_USER and NEO4J_PASSWORD:
+ auth = (NEO4J_USER, NEO4J_PASSWORD)
+ _neo4j_driver = GraphDatabase.driver(NEO4J_URI, auth=auth)
+ return _neo4j_driver
+
+
+def _run_statements(tx, statements: list[tuple[str, dict]]) -> None:
+ for statement, parameters in statements:
+ tx.run(statement, parameters).consume
+
+
+def run_cypher_batch(statements: list[tuple[str, dict]]) -> None:
+ """Execute parameterized Cypher statements in one write transaction."""
+ with _get_neo4j_driver.session as session:
+ session.execute_write(_run_statements, statements)
+
+
+def run_cypher(cypher: str, parameters: dict | None = None) -> list | None:
+ """Execute a single Cypher statement and return its records."""
+ try:
+ records, _, _ = _get_neo4j_driver.execute_query(cypher, parameters or {})
+ except (DriverError, Neo4jError):
+ return None
+ return records
 
 
-def run_cypher(cypher: str) -> dict | None:
- """Execute Cypher via HTTP API."""
+def flush_statements(pending: list[tuple[str, dict]]) -> None:
+ """Send pending statements as one transaction and clear the list."""
+ if not pending:
+ return
  try:
- result = subprocess.run(
- [
- "curl", "-s",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"statements": [{"statement": cypher}]}),
- f"{NEO4J_URL}/db/neo4j/tx/commit",
- ],
- capture_output=True,
- text=True,
- timeout=10,
+ run_cypher_batch(pending)
+ except Neo4jError as e:
+ console.print(f"[red]Neo4j rejected batch: {e.message}[/red]")
+ except DriverError:
+ console.print(f"[red]Neo4j request failed; {len(pending)} statements not applied[/red]")
+ pending.clear
+
+
+def flush_rows(node_rows: list[dict], edge_rows_by_predicate: dict[str, list[dict]]) -> None:
+ """Send buffered node and edge rows as one UNWIND transaction and clear them."""
+ statements: list[tuple[str, dict]] = []
+ if node_rows:
+ statements.append((ENTITY_NODE_CYPHER, {"rows": node_rows}))
+ for predicate, rows in edge_rows_by_predicate.items:
+ statements.append((EDGE_CYPHER.format(predicate=predicate), {"rows": rows}))
+ flush_statements(statements)
+ node_rows.clear
+ edge_rows_by_predicate.clear
+
+
+def entity_hash(title: str, metadata: dict) -> str:
+ """Hash everything an entity contributes to the graph, to detect unchanged entities."""
+ content = orjson.dumps(
+ {
+ "title": title,
+ "corpus": metadata.get("corpus", ""),
+ "content_type": metadata.get("content_type", ""),
+ "edges": metadata.get("detected_edges", []),
+ },
+ option=orjson.OPT_SORT_KEYS,
  )
- return json.loads(result.stdout) if result.returncode == 0 else None
- except Exception:
- return None
+ return hashlib.blake2b(content, digest_size=16).hexdigest
+
+
+def materialize_batch(entities: list[tuple[str, str, dict, str]], force: bool = False) -> tuple[int, int]:
+ """
+ Write a batch of (id, title, metadata, content_hash) entities to Neo4j.
+
+ Entities whose stored content_hash matches are skipped unless force is
+ set. The hash is written in the same transaction as the node and its
+ edges, so a failed batch is retried on the next run.
+
+ Returns:
+ (nodes written, edges written)
+ """
+ stored: dict[str, str] = {}
+ if not force:
+ records = run_cypher(STORED_HASHES_CYPHER, {"ids": [entity[0] for entity in entities]})
+ stored = {record["id"]: record["content_hash"] for record in records or []}
+
+ node_rows: list[dict] = []
+ edge_rows_by_predicate: dict[str, list[dict]] = {}
+ edge_count = 0
+ for entity_id, title, metadata, content_hash in entities:
+ if stored.get(entity_id) == content_hash:
+ continue
+
+ node_rows.append({
+ "id": entity_id,
+ "title": title,
+ "corpus": metadata.get("corpus", ""),
+ "content_type": metadata.get("content_type", ""),
+ "content_hash": content_hash,
+ })
+
+ for edge in metadata.get("detected_edges", []):
+ target = edge.get("target_concept", "")
+ predicate = REL_TYPE_INVALID_CHARS.sub("_", edge.get("predicate", "related_to").upper)
+
+ # An empty type is invalid Cypher and would fail the whole batch
+ if not target or not predicate:
+ continue
+
+ edge_rows_by_predicate.setdefault(predicate, []).append({
+ "sid": entity_id,
+ "tid": target,
+ "strength": edge.get("strength", 0.5),
+ "rationale": edge.get("rationale", ""),
+ })
+ edge_count += 1
+
+ node_count = len(node_rows)
+ flush_rows(node_rows, edge_rows_by_predicate)
+ return node_count, edge_count
 
 
 def clear_graph -> None:
@@ -66,6 +208,7 @@ def main:
  parser = argparse.ArgumentParser(description="Materialize entity edges to Neo4j")
  parser.add_argument("--dry-run", action="store_true", help="Show counts without writing")
  parser.add_argument("--clear", action="store_true", help="Clear graph before materializing")
+ parser.add_argument("--force", action="store_true", help="Rewrite entities even if unchanged")
  args = parser.parse_args
 
  console.print
@@ -76,40 +219,49 @@ def main:
  # Check Neo4j connectivity
  health = run_cypher("RETURN 1")
  if health is None:
- console.print("[red]Cannot connect to Neo4j at {NEO4J_URL}[/red]")
+ console.print(f"[red]Cannot connect to Neo4j at {NEO4J_URI}[/red]")
  return 1
 
  if args.clear and not args.dry_run:
  clear_graph
 
- # Get entities with edges
+ # Count entities with edges up front; the rows themselves are streamed below
  conn = get_db_connection
  cursor = conn.cursor
  cursor.execute(
- """
- SELECT id, title, metadata
+ f"""
+ SELECT count(*), coalesce(sum(jsonb_array_length(metadata->'detected_edges')), 0)
  FROM entity
- WHERE metadata->'detected_edges' IS NOT NULL
- AND jsonb_array_length(metadata->'detected_edges') > 0
- ORDER BY id
+ WHERE {ENTITY_EDGES_FILTER}
  """
  )
- entities = cursor.fetchall
- conn.close
+ entity_total, edge_total = cursor.fetchone
 
- console.print(f"Found {len(entities)} entities with detected edges")
+ console.print(f"Found {entity_total} entities with detected edges")
 
  if args.dry_run:
- total_edges = 0
- for _, _, metadata in entities:
- edges = (metadata or {}).get("detected_edges", [])
- total_edges += len(edges)
- console.print(f"Would create {len(entities)} entity nodes and {total_edges} edges")
+ conn.close
+ console.print(f"Would create {entity_total} entity nodes and {edge_total} edges")
  return 0
 
+ # Server-side cursor: rows arrive ENTITY_FETCH_SIZE at a time while batches are written
+ cursor = conn.cursor(name="entities_cur")
+ cursor.itersize = ENTITY_FETCH_SIZE
+ cursor.execute(
+ f"""
+ SELECT id, title, metadata
+ FROM entity
+ WHERE {ENTITY_EDGES_FILTER}
+ ORDER BY id
+ """
+ )
+
  # Materialize
  node_count = 0
  edge_count = 0
+ skipped_count = 0
+ batch: list[tuple[str, str, dict, str]] = []
+ buffered = 0
 
  with Progress(
  SpinnerColumn,
@@ -117,61 +269,51 @@ def main:
  console=console,
  transient=True,
  ) as progress:
- task = progress.add_task("Materializing...", total=len(entities))
+ task = progress.add_task("Materializing...", total=entity_total)
 
- for entity_id, title, metadata in entities:
+ for entity_id, title, metadata in cursor:
  progress.update(task, description=f"Processing {entity_id}...")
  metadata = metadata or {}
- corpus = metadata.get("corpus", "")
- ct = metadata.get("content_type", "")
-
- # Create entity node
- cypher = (
- f"MERGE (n:Entity {{id: '{entity_id}'}}) "
- f"SET n.title = '{neo4j_escape(title or '')}', "
- f"n.corpus = '{neo4j_escape(corpus)}', "
- f"n.content_type = '{neo4j_escape(ct)}'"
- )
- run_cypher(cypher)
- node_count += 1
+ title = title or ""
 
- # Create edges
- for edge in metadata.get("detected_edges", []):
- target = edge.get("target_concept", "")
- predicate = edge.get("predicate", "related_to").upper.replace(" ", "_")
- strength = edge.get("strength", 0.5)
- rationale = neo4j_escape(edge.get("rationale", ""))
+ batch.append((entity_id, title, metadata, entity_hash(title, metadata)))
+ buffered += 1 + len(metadata.get("detected_edges", []))
 
- if not target:
- continue
-
- cypher = (
- f"MERGE (s:Entity {{id: '{entity_id}'}}) "
- f"MERGE (t:Concept {{id: '{target}'}}) "
- f"MERGE (s)-[r:{predicate}]->(t) "
- f"SET r.strength = {strength}, r.rationale = '{rationale}'"
- )
- run_cypher(cypher)
- edge_count += 1
+ if buffered >= NEO4J_BATCH_SIZE:
+ nodes, edges = materialize_batch(batch, force=args.force)
+ node_count += nodes
+ edge_count += edges
+ skipped_count += len(batch) - nodes
+ batch.clear
+ buffered = 0
 
  progress.advance(task)
 
+ if batch:
+ nodes, edges = materialize_batch(batch, force=args.force)
+ node_count += nodes
+ edge_count += edges
+ skipped_count += len(batch) - nodes
+
+ cursor.close
+ conn.close
+
  console.print
  console.print(f"[green]Entity nodes created/updated:[/green] {node_count}")
  console.print(f"[green]Edges materialized:[/green] {edge_count}")
+ console.print(f"[dim]Unchanged entities skipped:[/dim] {skipped_count}")
 
  # Show graph stats
- result = run_cypher("MATCH (n) RETURN count(n) as nodes")
- if result and result.get("results"):
- total = result["results"][0]["data"][0]["row"][0]
- console.print(f"[blue]Total graph nodes:[/blue] {total}")
+ records = run_cypher("MATCH (n) RETURN count(n) as nodes")
+ if records:
+ console.print(f"[blue]Total graph nodes:[/blue] {records[0]['nodes']}")
 
- result = run_cypher("MATCH -[r]-> RETURN count(r) as rels")
- if result and result.get("results"):
- total = result["results"][0]["data"][0]["row"][0]
- console.print(f"[blue]Total graph relationships:[/blue] {total}")
+ records = run_cypher("MATCH -[r]-> RETURN count(r) as rels")
+ if records:
+ console.print(f"[blue]Total graph relationships:[/blue] {records[0]['rels']}")
 
  console.print
+ _get_neo4j_driver.close
  return 0
 
 
@@ -8,204 +8,422 @@ Routes queries through semantic search with tiered confidence handling:
 - Low confidence (<0.6): Suggest related topics or escalate
 
 Usage:
- python scripts/rag_query.py "what is semantic coherence"
- python scripts/rag_query.py "DDD patterns" --verbose
- python scripts/rag_query.py "explain the regression paradox" --use-llm
+    python scripts/rag_query.py "what is semantic coherence"
+    python scripts/rag_query.py "DDD patterns" --verbose
+    python scripts/rag_query.py "explain the regression paradox" --use-llm
+    python scripts/rag_query.py --interactive --verbose
 """
 
+from __future__ import annotations
+
 import argparse
-import json
+import hashlib
+import heapq
+import math
 import os
-import subprocess
 import sys
+import tempfile
+from array import array
 from dataclasses import dataclass
 from enum import Enum
+from operator import attrgetter
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+# httpx, orjson, psycopg and db_utils are imported where they are used, so
+# --help and argument errors don't pay for them at start-up
+if TYPE_CHECKING:
+    import httpx
+    import psycopg
 
 OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 EMBEDDING_MODEL = "nomic-embed-text"
 LLM_MODEL = "mistral"
 
+# Query embeddings are cached as raw little-endian float32, keyed by model + text
+EMBED_CACHE_DIR = Path(
+    os.environ.get("SEMOPS_CACHE_DIR", Path.home() / ".cache" / "semops")
+) / "embed"
+
 # Confidence thresholds
 HIGH_CONFIDENCE = 0.80
 MEDIUM_CONFIDENCE = 0.60
 
 
+# Keep-alive client shared by embedding and generation calls
+_ollama_client: httpx.Client | None = None
+
+
+def _get_ollama_client() -> httpx.Client:
+    """Get the shared Ollama client."""
+    global _ollama_client
+    if _ollama_client is None:
+        import httpx
+
+        _ollama_client = httpx.Client(base_url=OLLAMA_HOST, timeout=60)
+    return _ollama_client
+
+
 class ConfidenceLevel(Enum):
- HIGH = "high"
- MEDIUM = "medium"
- LOW = "low"
+    HIGH = "high"
+    MEDIUM = "medium"
+    LOW = "low"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SearchResult:
- source: str
- content: str
- similarity: float
- hierarchy: list[str]
- result_type: str # "concept" or "chunk"
+    source: str
+    content: str
+    similarity: float
+    hierarchy: tuple[str, ...]
+    result_type: str  # "concept" or "chunk"
 
 
 @dataclass
 class QueryResponse:
- confidence_level: ConfidenceLevel
- confidence_score: float
- results: list[SearchResult]
- answer: str | None = None
- caveats: list[str] | None = None
- suggestions: list[str] | None = None
+    confidence_level: ConfidenceLevel
+    confidence_score: float
+    results: list[SearchResult]
+    answer: str | None = None
+    caveats: list[str] | None = None
+    suggestions: list[str] | None = None
+
+
+def _embedding_cache_path(text: str) -> Path:
+    key = hashlib.sha256(f"{EMBEDDING_MODEL}\0{text}".encode()).hexdigest()
+    return EMBED_CACHE_DIR / f"{key}.f32"
+
+
+def _read_cached_embedding(path: Path) -> list[float] | None:
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if not data or len(data) % 4:
+        return None
+    vector = array("f")
+    vector.frombytes(data)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector.tolist()
+
+
+def _write_cached_embedding(path: Path, embedding: list[float]) -> None:
+    vector = array("f", embedding)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            vector.tofile(f)
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is best-effort; a failed write just means a miss next time
+        pass
 
 
 def generate_embedding(text: str) -> list[float] | None:
- """Generate embedding using Ollama."""
- try:
- result = subprocess.run(
- [
- "curl", "-s", f"{OLLAMA_HOST}/api/embeddings",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({"model": EMBEDDING_MODEL, "prompt": text})
- ],
- capture_output=True,
- text=True,
- timeout=30
- )
-
- if result.returncode != 0:
- return None
-
- response = json.loads(result.stdout)
- return response.get("embedding")
-
- except (subprocess.TimeoutExpired, json.JSONDecodeError):
- return None
-
-
-def search_concepts(embedding: list[float], limit: int = 3) -> list[SearchResult]:
- """Search concepts by embedding similarity."""
- embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-
- sql = f"""
- SELECT json_agg(row_to_json(t)) FROM (
- SELECT
- id,
- preferred_label,
- definition,
- 1 - (embedding_local <=> '{embedding_str}'::vector) as similarity
- FROM concept
- WHERE embedding_local IS NOT NULL
- ORDER BY embedding_local <=> '{embedding_str}'::vector
- LIMIT {limit}
- ) t;
- """
-
- result = subprocess.run(
- ["docker", "exec", "supabase-db", "psql", "-U", "postgres", "-d", "postgres",
- "-t", "-A", "-c", sql],
- capture_output=True,
- text=True
- )
-
- if result.returncode != 0:
- return []
-
- results = []
- try:
- data = json.loads(result.stdout.strip)
- if data:
- for row in data:
- results.append(SearchResult(
- source=row["id"],
- content=f"{row['preferred_label']}: {row['definition']}",
- similarity=row["similarity"],
- hierarchy=[row["preferred_label"]],
- result_type="concept"
- ))
- except json.JSONDecodeError:
- pass
-
- return results
-
-
-def search_chunks(embedding: list[float], limit: int = 3) -> list[SearchResult]:
- """Search document chunks by embedding similarity."""
- embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-
- sql = f"""
- SELECT json_agg(row_to_json(t)) FROM (
- SELECT
- source_file,
- heading_hierarchy,
- LEFT(content, 500) as content,
- 1 - (embedding <=> '{embedding_str}'::vector) as similarity
- FROM document_chunk
- WHERE embedding IS NOT NULL
- ORDER BY embedding <=> '{embedding_str}'::vector
- LIMIT {limit}
- ) t;
- """
-
- result = subprocess.run(
- ["docker", "exec", "supabase-db", "psql", "-U", "postgres", "-d", "postgres",
- "-t", "-A", "-c", sql],
- capture_output=True,
- text=True
- )
-
- if result.returncode != 0:
- return []
-
- results = []
- try:
- data = json.loads(result.stdout.strip)
- if data:
- for row in data:
- source_name = row["source_file"].split("/")[-1] if row["source_file"] else "unknown"
- results.append(SearchResult(
- source=source_name,
- content=row["content"],
- similarity=row["similarity"],
- hierarchy=row["heading_hierarchy"] or [],
- result_type="chunk"
- ))
- except json.JSONDecodeError:
- pass
-
- return results
-
-
-def compute_confidence(results: list[SearchResult]) -> tuple[ConfidenceLevel, float]:
- """
- Compute confidence level from search results.
-
- Uses the top result's similarity, with adjustments:
- - Bonus for multiple high-similarity results
- - Penalty if results are very inconsistent
- """
- if not results:
- return ConfidenceLevel.LOW, 0.0
-
- top_similarity = results[0].similarity
-
- # Compute consistency bonus/penalty
- if len(results) > 1:
- similarities = [r.similarity for r in results]
- variance = sum((s - top_similarity) ** 2 for s in similarities) / len(similarities)
- consistency_factor = 1.0 - min(variance * 10, 0.2) # Max 20% adjustment
- else:
- consistency_factor = 0.9 # Small penalty for single result
-
- adjusted_confidence = top_similarity * consistency_factor
-
- if adjusted_confidence >= HIGH_CONFIDENCE:
- return ConfidenceLevel.HIGH, adjusted_confidence
- elif adjusted_confidence >= MEDIUM_CONFIDENCE:
- return ConfidenceLevel.MEDIUM, adjusted_confidence
- else:
- return ConfidenceLevel.LOW, adjusted_confidence
+    """Generate embedding using Ollama, reusing the on-disk cache when possible."""
+    cache_path = _embedding_cache_path(text)
+    cached = _read_cached_embedding(cache_path)
+    if cached is not None:
+        return cached
+
+    import httpx
+    import orjson
+
+    try:
+        response = _get_ollama_client().post(
+            "/api/embeddings",
+            content=orjson.dumps({"model": EMBEDDING_MODEL, "prompt": text}),
+            headers={"Content-Type": "application/json"},
+            timeout=30,
+        )
+        response.raise_for_status()
+        embedding = orjson.loads(response.content).get("embedding")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+    if embedding:
+        _write_cached_embedding(cache_path, embedding)
+    return embedding
+
+
+# Read-only connection shared by every search in this process
+_conn: psycopg.Connection | None = None
+
+
+def _get_conn() -> psycopg.Connection:
+    """Get the shared database connection, opening it on first use."""
+    global _conn
+    if _conn is None or _conn.closed:
+        from db_utils import get_db_connection
+
+        _conn = get_db_connection(autocommit=True)
+    return _conn
+
+
+CONCEPT_SEARCH_SQL = """
+    SELECT
+        id,
+        preferred_label,
+        definition,
+        1 - (embedding_local <=> %(embedding)s::vector) as similarity
+    FROM concept
+    WHERE embedding_local IS NOT NULL
+    ORDER BY embedding_local <=> %(embedding)s::vector
+    LIMIT %(limit)s
+"""
+
+CHUNK_SEARCH_SQL = """
+    SELECT
+        source_file,
+        heading_hierarchy,
+        LEFT(content, 500) as content,
+        1 - (embedding <=> %(embedding)s::vector) as similarity
+    FROM document_chunk
+    WHERE embedding IS NOT NULL
+    ORDER BY embedding <=> %(embedding)s::vector
+    LIMIT %(limit)s
+"""
+
+# Both searches, the top-K merge and the confidence spread in one statement.
+# Rows come back as plain typed columns (read with a binary cursor), so no
+# JSON is built on the server or parsed here.
+RANKED_SEARCH_SQL = """
+    WITH concept_hits AS (
+        SELECT
+            'concept' AS result_type,
+            id AS source,
+            preferred_label || ': ' || coalesce(definition, '') AS content,
+            1 - (embedding_local <=> %(embedding)s::vector) AS similarity,
+            ARRAY[preferred_label]::text[] AS hierarchy
+        FROM concept
+        WHERE embedding_local IS NOT NULL
+        ORDER BY embedding_local <=> %(embedding)s::vector
+        LIMIT %(limit)s
+    ),
+    chunk_hits AS (
+        SELECT
+            'chunk' AS result_type,
+            coalesce(substring(nullif(source_file, '') from '[^/]*$'), 'unknown') AS source,
+            LEFT(content, 500) AS content,
+            1 - (embedding <=> %(embedding)s::vector) AS similarity,
+            heading_hierarchy::text[] AS hierarchy
+        FROM document_chunk
+        WHERE embedding IS NOT NULL
+        ORDER BY embedding <=> %(embedding)s::vector
+        LIMIT %(limit)s
+    ),
+    top_hits AS (
+        SELECT * FROM concept_hits
+        UNION ALL
+        SELECT * FROM chunk_hits
+        ORDER BY similarity DESC
+        LIMIT %(top_k)s
+    )
+    SELECT
+        result_type,
+        source,
+        content,
+        similarity,
+        hierarchy,
+        -- mean squared distance from the top hit = var_pop + (max - mean)^2
+        var_pop(similarity) OVER () + power(max(similarity) OVER () - avg(similarity) OVER (), 2)
+    FROM top_hits
+    ORDER BY similarity DESC
+"""
+
+
+def to_vector_literal(embedding: list[float]) -> str:
+    """
+    Render an embedding as a pgvector text literal.
+
+    Built once per query and bound as text for every search, so the
+    vector is not re-adapted per statement. Seven significant digits
+    round-trip float32, which is what pgvector stores.
+    """
+    return "[" + ",".join([format(x, ".7g") for x in embedding]) + "]"
+
+
+_get_similarity = attrgetter("similarity")
+
+
+def _concept_results(rows: list[tuple]) -> list[SearchResult]:
+    return [
+        SearchResult(
+            source=concept_id,
+            content=f"{label}: {definition}",
+            similarity=similarity,
+            hierarchy=(label,),
+            result_type="concept",
+        )
+        for concept_id, label, definition, similarity in rows
+    ]
+
+
+def _chunk_results(rows: list[tuple]) -> list[SearchResult]:
+    return [
+        SearchResult(
+            source=source_file.split("/")[-1] if source_file else "unknown",
+            content=content,
+            similarity=similarity,
+            hierarchy=tuple(heading_hierarchy or ()),
+            result_type="chunk",
+        )
+        for source_file, heading_hierarchy, content, similarity in rows
+    ]
+
+
+def search_concepts(embedding: list[float] | str, limit: int = 3) -> list[SearchResult]:
+    """Search concepts by embedding similarity."""
+    import psycopg
+
+    try:
+        with _get_conn().cursor() as cur:
+            cur.execute(CONCEPT_SEARCH_SQL, {"embedding": embedding, "limit": limit})
+            rows = cur.fetchall()
+    except psycopg.Error:
+        return []
+
+    return _concept_results(rows)
+
+
+def search_chunks(embedding: list[float] | str, limit: int = 3) -> list[SearchResult]:
+    """Search document chunks by embedding similarity."""
+    import psycopg
+
+    try:
+        with _get_conn().cursor() as cur:
+            cur.execute(CHUNK_SEARCH_SQL, {"embedding": embedding, "limit": limit})
+            rows = cur.fetchall()
+    except psycopg.Error:
+        return []
+
+    return _chunk_results(rows)
+
+
+def _merge_by_similarity(
+    concepts: list[SearchResult],
+    chunks: list[SearchResult],
+) -> list[SearchResult]:
+    # Each search comes back ordered by similarity already; merge the two runs
+    # instead of re-sorting the combined list
+    return list(heapq.merge(concepts, chunks, key=_get_similarity, reverse=True))
+
+
+def search_all(embedding: list[float] | str, limit: int = 3) -> list[SearchResult]:
+    """
+    Search concepts and document chunks in a single round trip.
+
+    Results are merged into one list ordered by similarity.
+
+    Both queries are queued in one pipeline, so the server works through
+    them back to back instead of waiting on the client between the two.
+    Falls back to the per-table searches if the pipeline fails, and
+    returns no results if the database cannot be reached at all.
+    """
+    import psycopg
+
+    params = {"embedding": embedding, "limit": limit}
+    try:
+        conn = _get_conn()
+    except psycopg.Error:
+        return []
+
+    try:
+        with conn.pipeline():
+            concept_cur = conn.execute(CONCEPT_SEARCH_SQL, params)
+            chunk_cur = conn.execute(CHUNK_SEARCH_SQL, params)
+            concept_rows = concept_cur.fetchall()
+            chunk_rows = chunk_cur.fetchall()
+    except psycopg.Error:
+        return _merge_by_similarity(
+            search_concepts(embedding, limit),
+            search_chunks(embedding, limit),
+        )
+
+    return _merge_by_similarity(_concept_results(concept_rows), _chunk_results(chunk_rows))
+
+
+def search_ranked(
+    embedding: list[float] | str,
+    limit: int = 3,
+    top_k: int = 5,
+) -> tuple[list[SearchResult], float | None]:
+    """
+    Search concepts and chunks and merge the top hits server-side.
+
+    Returns the top_k results by similarity together with their spread
+    around the top hit, as used by compute_confidence. If the fused query
+    fails, falls back to search_all and leaves the spread to the caller.
+    """
+    import psycopg
+
+    params = {"embedding": embedding, "limit": limit, "top_k": top_k}
+    try:
+        with _get_conn().cursor(binary=True) as cur:
+            cur.execute(RANKED_SEARCH_SQL, params)
+            rows = cur.fetchall()
+    except psycopg.Error:
+        return search_all(embedding, limit)[:top_k], None
+
+    results = [
+        SearchResult(
+            source=source,
+            content=content,
+            similarity=similarity,
+            hierarchy=tuple(hierarchy or ()),
+            result_type=result_type,
+        )
+        for result_type, source, content, similarity, hierarchy, _ in rows
+    ]
+    return results, rows[0][5] if rows else None
+
+
+def compute_confidence(
+    results: list[SearchResult],
+    spread: float | None = None,
+) -> tuple[ConfidenceLevel, float]:
+    """
+    Compute confidence level from search results.
+
+    Uses the top result's similarity, with adjustments:
+    - Bonus for multiple high-similarity results
+    - Penalty if results are very inconsistent
+
+    spread is the mean squared distance of the results from the top hit;
+    pass it when it was already computed alongside the search.
+    """
+    if not results:
+        return ConfidenceLevel.LOW, 0.0
+
+    top_similarity = results[0].similarity
+
+    # Compute consistency bonus/penalty
+    if len(results) > 1:
+        if spread is None:
+            # Mean squared spread around the top hit; sumprod runs the loop in C
+            deltas = [r.similarity - top_similarity for r in results]
+            spread = math.sumprod(deltas, deltas) / len(deltas)
+        consistency_factor = 1.0 - min(spread * 10, 0.2)  # Max 20% adjustment
+    else:
+        consistency_factor = 0.9  # Small penalty for single result
+
+    adjusted_confidence = top_similarity * consistency_factor
+
+    if adjusted_confidence >= HIGH_CONFIDENCE:
+        return ConfidenceLevel.HIGH, adjusted_confidence
+    elif adjusted_confidence >= MEDIUM_CONFIDENCE:
+        return ConfidenceLevel.MEDIUM, adjusted_confidence
+    else:
+        return ConfidenceLevel.LOW, adjusted_confidence
 
 
 def generate_llm_answer(query: str, context: str) -> str:
- """Generate answer using local LLM."""
- prompt = f"""Based on the following context, answer the question concisely.
+    """Generate answer using local LLM."""
+    prompt = f"""Based on the following context, answer the question concisely.
 
 Context:
 {context}
@@ -214,175 +432,201 @@ Question: {query}
 
 Answer:"""
 
- try:
- result = subprocess.run(
- [
- "curl", "-s", f"{OLLAMA_HOST}/api/generate",
- "-H", "Content-Type: application/json",
- "-d", json.dumps({
- "model": LLM_MODEL,
- "prompt": prompt,
- "stream": False
- })
- ],
- capture_output=True,
- text=True,
- timeout=60
- )
-
- if result.returncode != 0:
- return "Error generating response"
-
- response = json.loads(result.stdout)
- return response.get("response", "No response generated")
-
- except (subprocess.TimeoutExpired, json.JSONDecodeError) as e:
- return f"Error: {e}"
+    import httpx
+    import orjson
+
+    try:
+        response = _get_ollama_client().post(
+            "/api/generate",
+            content=orjson.dumps({
+                "model": LLM_MODEL,
+                "prompt": prompt,
+                "stream": False,
+            }),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return "Error generating response"
+
+    try:
+        return orjson.loads(response.content).get("response", "No response generated")
+    except ValueError as e:
+        return f"Error: {e}"
 
 
 def route_query(
- query: str,
- use_llm: bool = False,
- verbose: bool = False
+    query: str,
+    use_llm: bool = False,
+    verbose: bool = False,
 ) -> QueryResponse:
- """
- Route a query through the RAG pipeline with confidence-based handling.
- """
- # Generate embedding
- embedding = generate_embedding(query)
- if embedding is None:
- return QueryResponse(
- confidence_level=ConfidenceLevel.LOW,
- confidence_score=0.0,
- results=[],
- answer="Error: Could not generate query embedding"
- )
-
- # Search both concepts and chunks
- concept_results = search_concepts(embedding, limit=3)
- chunk_results = search_chunks(embedding, limit=3)
-
- # Merge and sort by similarity
- all_results = concept_results + chunk_results
- all_results.sort(key=lambda r: r.similarity, reverse=True)
- top_results = all_results[:5]
-
- # Compute confidence
- confidence_level, confidence_score = compute_confidence(top_results)
-
- # Route based on confidence
- if confidence_level == ConfidenceLevel.HIGH:
- # High confidence: provide direct answer
- context = "\n\n".join([r.content for r in top_results[:3]])
-
- if use_llm:
- answer = generate_llm_answer(query, context)
- else:
- # Return top result as answer
- answer = top_results[0].content
-
- return QueryResponse(
- confidence_level=confidence_level,
- confidence_score=confidence_score,
- results=top_results,
- answer=answer
- )
-
- elif confidence_level == ConfidenceLevel.MEDIUM:
- # Medium confidence: answer with caveats
- context = "\n\n".join([r.content for r in top_results[:3]])
-
- if use_llm:
- answer = generate_llm_answer(query, context)
- else:
- answer = top_results[0].content
-
- caveats = [
- f"Confidence: {confidence_score:.0%}",
- "Results may be tangentially related",
- "Consider refining your query for better results"
- ]
-
- return QueryResponse(
- confidence_level=confidence_level,
- confidence_score=confidence_score,
- results=top_results,
- answer=answer,
- caveats=caveats
- )
-
- else:
- # Low confidence: suggest related topics
- suggestions = []
- if top_results:
- for r in top_results[:3]:
- if r.result_type == "concept":
- suggestions.append(f"Concept: {r.source}")
- else:
- if r.hierarchy:
- suggestions.append(f"Topic: {' > '.join(r.hierarchy[:2])}")
-
- return QueryResponse(
- confidence_level=confidence_level,
- confidence_score=confidence_score,
- results=top_results,
- answer=None,
- suggestions=suggestions if suggestions else [
- "No closely related content found",
- "Try rephrasing your query",
- "Consider broader or more specific terms"
- ]
- )
-
-
-def main:
- parser = argparse.ArgumentParser(description="RAG query with confidence routing")
- parser.add_argument("query", type=str, help="Search query")
- parser.add_argument("--use-llm", action="store_true", help="Use LLM for answer generation")
- parser.add_argument("--verbose", action="store_true", help="Show detailed results")
- args = parser.parse_args
-
- print(f"Query: {args.query}")
- print("=" * 70)
-
- response = route_query(args.query, use_llm=args.use_llm, verbose=args.verbose)
-
- # Display confidence
- conf_pct = response.confidence_score * 100
- print(f"\nConfidence: {response.confidence_level.value.upper} ({conf_pct:.1f}%)")
- print("-" * 70)
-
- # Display based on confidence level
- if response.confidence_level == ConfidenceLevel.HIGH:
- print("\nAnswer:")
- print(f" {response.answer}")
-
- elif response.confidence_level == ConfidenceLevel.MEDIUM:
- print("\nAnswer (with caveats):")
- print(f" {response.answer}")
- print("\nCaveats:")
- for caveat in response.caveats or []:
- print(f" - {caveat}")
-
- else: # LOW
- print("\nNo confident answer found.")
- if response.suggestions:
- print("\nRelated topics to explore:")
- for suggestion in response.suggestions:
- print(f" - {suggestion}")
-
- # Show sources if verbose
- if args.verbose and response.results:
- print("\n" + "-" * 70)
- print("Sources:")
- for i, r in enumerate(response.results[:5], 1):
- sim_pct = r.similarity * 100
- print(f"\n{i}. [{r.result_type}] {r.source} ({sim_pct:.1f}%)")
- hierarchy = " > ".join(r.hierarchy) if r.hierarchy else "(root)"
- print(f" Path: {hierarchy}")
- content_preview = r.content[:150] + "..." if len(r.content) > 150 else r.content
- print(f" {content_preview}")
+    """
+    Route a query through the RAG pipeline with confidence-based handling.
+    """
+    # Generate embedding
+    embedding = generate_embedding(query)
+    if embedding is None:
+        return QueryResponse(
+            confidence_level=ConfidenceLevel.LOW,
+            confidence_score=0.0,
+            results=[],
+            answer="Error: Could not generate query embedding",
+        )
+
+    # Search concepts and chunks, merged to the top 5 by similarity in one query
+    top_results, spread = search_ranked(to_vector_literal(embedding), limit=3, top_k=5)
+
+    # Compute confidence
+    confidence_level, confidence_score = compute_confidence(top_results, spread)
+
+    # Route based on confidence
+    if confidence_level == ConfidenceLevel.HIGH:
+        # High confidence: provide direct answer
+        context = "\n\n".join([r.content for r in top_results[:3]])
+
+        if use_llm:
+            answer = generate_llm_answer(query, context)
+        else:
+            # Return top result as answer
+            answer = top_results[0].content
+
+        return QueryResponse(
+            confidence_level=confidence_level,
+            confidence_score=confidence_score,
+            results=top_results,
+            answer=answer,
+        )
+
+    elif confidence_level == ConfidenceLevel.MEDIUM:
+        # Medium confidence: answer with caveats
+        context = "\n\n".join([r.content for r in top_results[:3]])
+
+        if use_llm:
+            answer = generate_llm_answer(query, context)
+        else:
+            answer = top_results[0].content
+
+        caveats = [
+            f"Confidence: {confidence_score:.0%}",
+            "Results may be tangentially related",
+            "Consider refining your query for better results",
+        ]
+
+        return QueryResponse(
+            confidence_level=confidence_level,
+            confidence_score=confidence_score,
+            results=top_results,
+            answer=answer,
+            caveats=caveats,
+        )
+
+    else:
+        # Low confidence: suggest related topics
+        suggestions = []
+        if top_results:
+            for r in top_results[:3]:
+                if r.result_type == "concept":
+                    suggestions.append(f"Concept: {r.source}")
+                else:
+                    if r.hierarchy:
+                        suggestions.append(f"Topic: {' > '.join(r.hierarchy[:2])}")
+
+        return QueryResponse(
+            confidence_level=confidence_level,
+            confidence_score=confidence_score,
+            results=top_results,
+            answer=None,
+            suggestions=suggestions if suggestions else [
+                "No closely related content found",
+                "Try rephrasing your query",
+                "Consider broader or more specific terms",
+            ],
+        )
+
+
+def print_response(query: str, response: QueryResponse, verbose: bool = False) -> None:
+    """Print a routed response, with sources when verbose."""
+    print(f"Query: {query}")
+    print("=" * 70)
+
+    # Display confidence
+    conf_pct = response.confidence_score * 100
+    print(f"\nConfidence: {response.confidence_level.value.upper()} ({conf_pct:.1f}%)")
+    print("-" * 70)
+
+    # Display based on confidence level
+    if response.confidence_level == ConfidenceLevel.HIGH:
+        print("\nAnswer:")
+        print(f" {response.answer}")
+
+    elif response.confidence_level == ConfidenceLevel.MEDIUM:
+        print("\nAnswer (with caveats):")
+        print(f" {response.answer}")
+        print("\nCaveats:")
+        for caveat in response.caveats or []:
+            print(f" - {caveat}")
+
+    else:  # LOW
+        print("\nNo confident answer found.")
+        if response.suggestions:
+            print("\nRelated topics to explore:")
+            for suggestion in response.suggestions:
+                print(f" - {suggestion}")
+
+    # Show sources if verbose
+    if verbose and response.results:
+        print("\n" + "-" * 70)
+        print("Sources:")
+        for i, r in enumerate(response.results[:5], 1):
+            sim_pct = r.similarity * 100
+            print(f"\n{i}. [{r.result_type}] {r.source} ({sim_pct:.1f}%)")
+            hierarchy = " > ".join(r.hierarchy) if r.hierarchy else "(root)"
+            print(f" Path: {hierarchy}")
+            content_preview = r.content[:150] + "..." if len(r.content) > 150 else r.content
+            print(f" {content_preview}")
+
+
+def run_interactive(use_llm: bool = False, verbose: bool = False) -> None:
+    """
+    Answer queries from stdin until an empty line or EOF.
+
+    One process serves every query, so imports, the database connection
+    and the Ollama client are set up once instead of per invocation.
+    """
+    while True:
+        try:
+            query = input("> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not query:
+            break
+        print_response(query, route_query(query, use_llm=use_llm, verbose=verbose), verbose)
+        print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RAG query with confidence routing")
+    parser.add_argument("query", type=str, nargs="?", help="Search query")
+    parser.add_argument("--use-llm", action="store_true", help="Use LLM for answer generation")
+    parser.add_argument("--verbose", action="store_true", help="Show detailed results")
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Read queries from a prompt until an empty line",
+    )
+    args = parser.parse_args()
+
+    if args.query is None and not args.interactive:
+        parser.error("a query is required unless --interactive is given")
+
+    if args.query is not None:
+        response = route_query(args.query, use_llm=args.use_llm, verbose=args.verbose)
+        print_response(args.query, response, verbose=args.verbose)
+
+    if args.interactive:
+        run_interactive(use_llm=args.use_llm, verbose=args.verbose)
 
 
 if __name__ == "__main__":
- main
+    main()
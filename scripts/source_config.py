@@ -92,6 +92,7 @@ class LLMClassifyConfig(BaseModel):
  enabled: bool = True
  model: str = "claude-opus-4-5-20251101"
  fields: list[str] = Field(default_factory=list)
+ concurrency: int = Field(default=4, ge=1) # Max in-flight classification requests
 
 
 def _validate_corpus(v: str) -> str: